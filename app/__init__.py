@@ -1,6 +1,5 @@
 # Imports
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_bootstrap import Bootstrap
@@ -9,19 +8,39 @@ import os
 
 # local imports
 from config import app_config
+from .cache import ChartCache
+from .database import Database
+from .jobs import JobQueue
+from .metrics import Metrics
+from .identity import IdentityCache
+from .passwords import PasswordHasher
 
 # db variable initialization
-db = SQLAlchemy()
+db = Database()
 login_manager = LoginManager()
 login_manager.login_message = "You must be logged in to access this page."
 login_manager.login_view = "auth.login"
+chart_cache = ChartCache()
+jobs = JobQueue()
+identity = IdentityCache(session=db.session)
+passwords = PasswordHasher()
+metrics = Metrics()
 
 def create_app(config_name):
     if os.getenv('FLASK_CONFIG') == "production":
         app = Flask(__name__)
         app.config.update(
             SECRET_KEY=os.getenv('SECRET_KEY'),
-            SQLALCHEMY_DATABASE_URI=os.getenv('SQLALCHEMY_DATABASE_URI')
+            SQLALCHEMY_DATABASE_URI=os.getenv('SQLALCHEMY_DATABASE_URI'),
+            SQLALCHEMY_REPLICA_URI=os.getenv('SQLALCHEMY_REPLICA_URI'),
+            SQLALCHEMY_POOL_SIZE=int(os.getenv('SQLALCHEMY_POOL_SIZE', 10)),
+            SQLALCHEMY_MAX_OVERFLOW=int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', 20)),
+            SQLALCHEMY_POOL_TIMEOUT=int(os.getenv('SQLALCHEMY_POOL_TIMEOUT', 10)),
+            SQLALCHEMY_POOL_RECYCLE=int(os.getenv('SQLALCHEMY_POOL_RECYCLE', 1800)),
+            SQLALCHEMY_POOL_PRE_PING=os.getenv('SQLALCHEMY_POOL_PRE_PING', '1') != '0',
+            METRICS_ENABLED=os.getenv('METRICS_ENABLED', '1') != '0',
+            METRICS_TOKEN=os.getenv('METRICS_TOKEN'),
+            ENGINE_PRELOAD=os.getenv('ENGINE_PRELOAD', '0') != '0'
         )
     else:
         app = Flask(__name__, instance_relative_config=True)
@@ -34,6 +53,14 @@ def create_app(config_name):
     login_manager.login_message = "You must be logged in to access this page."
     login_manager.login_view = "auth.login"
     migrate = Migrate(app, db)
+    chart_cache.init_app(app)
+    jobs.init_app(app)
+    identity.init_app(app)
+    passwords.init_app(app)
+    metrics.init_app(app)
+    metrics.add_source('chart_cache', chart_cache.stats)
+    metrics.add_source('identity_cache', identity.stats)
+    jobs.observer = metrics.observe_stages
 
 
     # # Configure the data uploading via Flask-Uploads
@@ -52,4 +79,9 @@ def create_app(config_name):
     from .home import home as home_blueprint
     app.register_blueprint(home_blueprint)
 
+    # Import pandas and Bokeh now rather than on the first upload or analysis
+    if app.config.get('ENGINE_PRELOAD'):
+        from .auth import engine
+        engine.preload()
+
     return app
\ No newline at end of file
@@ -0,0 +1,44 @@
+# Imports
+import hmac
+import json
+
+from flask import abort, current_app, request
+from flask_login import current_user
+
+# Local Imports
+from . import admin
+from .. import login_manager, metrics
+
+
+def check_admin():
+    """
+    Prevent non-admins from accessing the page; scrapers may instead send
+    the METRICS_TOKEN as a bearer token
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if token:
+        # constant time comparison, so the token cannot be guessed from response times
+        sent = request.headers.get('Authorization', '').encode('utf-8')
+        if hmac.compare_digest(sent, 'Bearer {}'.format(token).encode('utf-8')):
+            return None
+    if not current_user.is_authenticated:
+        return login_manager.unauthorized()
+    if not current_user.is_admin:
+        abort(403)
+    return None
+
+
+@admin.route('/metrics')
+def show_metrics():
+    """
+    Latency histograms per route and stage, as Prometheus text or as JSON
+    with ?format=json
+    """
+    denied = check_admin()
+    if denied is not None:
+        return denied
+    if request.args.get('format') == 'json' or request.accept_mimetypes.best == 'application/json':
+        return current_app.response_class(json.dumps(metrics.to_json(), indent=2),
+                                          mimetype='application/json')
+    return current_app.response_class(metrics.to_prometheus(),
+                                      mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,113 @@
+# Imports
+import numpy as np
+import pandas as pd
+
+
+def month_codes(dates):
+    """
+    Map dates to months as integers counted from the first month present.
+    Returns the codes (-1 where the date is missing) and the months covered.
+    """
+    values = np.asarray(dates, dtype='datetime64[M]').astype(np.int64)
+    # NaT is stored as the smallest int64
+    valid = values != np.iinfo(np.int64).min
+    if not valid.any():
+        return np.full(len(values), -1, dtype=np.int64), np.array([], dtype='datetime64[M]')
+    first, last = values[valid].min(), values[valid].max()
+    codes = np.where(valid, values - first, -1)
+    return codes, np.arange(first, last + 1).astype('datetime64[M]')
+
+
+def segment_month_sums(segments, dates, weights):
+    """
+    Sum each array in weights by (segment, month) in one vectorized pass.
+    Rows with a missing segment or date are skipped and missing values count
+    as zero. Returns the sorted segments, the months they span and, for each
+    name in weights, a segments x months array of totals.
+    """
+    segment_codes, segment_labels = pd.factorize(np.asarray(segments, dtype=object), sort=True)
+    codes, months = month_codes(dates)
+
+    # one flat bucket per (segment, month)
+    valid = (segment_codes >= 0) & (codes >= 0)
+    shape = (len(segment_labels), len(months))
+    buckets = segment_codes[valid] * shape[1] + codes[valid]
+
+    sums = {'segments': np.asarray(segment_labels, dtype='U'), 'months': months}
+    for name, values in weights.items():
+        values = np.asarray(values, dtype=np.float64)[valid]
+        values = np.where(np.isnan(values), 0, values)
+        totals = np.bincount(buckets, weights=values, minlength=shape[0] * shape[1])
+        sums[name] = totals.reshape(shape)
+    return sums
+
+
+class SegmentMonthSums(object):
+    """
+    Running (segment, month) totals that chunks of rows are folded into one
+    at a time, so a file never has to be held in memory all at once
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.segments = []
+        self.positions = {}
+        self.first_month = None
+        self.sums = dict((name, np.zeros((0, 0))) for name in self.names)
+
+    def add(self, segments, dates, weights):
+        """
+        Fold a chunk of rows into the totals
+        """
+        self.merge(segment_month_sums(segments, dates, weights))
+
+    def merge(self, chunk):
+        """
+        Fold totals in the layout of segment_month_sums into these ones; only
+        the buckets of the segments and months they cover change
+        """
+        if not len(chunk['months']) or not len(chunk['segments']):
+            return
+        chunk_first = chunk['months'][0].astype(np.int64)
+
+        # widen the month range to cover the chunk
+        months = self.sums[self.names[0]].shape[1]
+        if self.first_month is None:
+            first, last = chunk_first, chunk_first + len(chunk['months'])
+        else:
+            first = min(self.first_month, chunk_first)
+            last = max(self.first_month + months, chunk_first + len(chunk['months']))
+        before = 0 if self.first_month is None else self.first_month - first
+        after = last - first - before - months
+
+        # add rows for segments not seen yet
+        for segment in chunk['segments']:
+            if segment not in self.positions:
+                self.positions[segment] = len(self.segments)
+                self.segments.append(segment)
+        rows = len(self.segments) - self.sums[self.names[0]].shape[0]
+
+        for name in self.names:
+            self.sums[name] = np.pad(self.sums[name], ((0, rows), (before, after)), mode='constant')
+        self.first_month = first
+
+        positions = np.array([self.positions[segment] for segment in chunk['segments']])
+        offset = chunk_first - first
+        columns = np.arange(offset, offset + len(chunk['months']))
+        for name in self.names:
+            self.sums[name][positions[:, None], columns] += chunk[name]
+
+    def result(self):
+        """
+        Totals in the same layout as segment_month_sums
+        """
+        order = np.argsort(np.asarray(self.segments, dtype='U'))
+        months = self.sums[self.names[0]].shape[1]
+        if self.first_month is None:
+            month_range = np.array([], dtype='datetime64[M]')
+        else:
+            month_range = np.arange(self.first_month, self.first_month + months).astype('datetime64[M]')
+        result = {'segments': np.asarray(self.segments, dtype='U')[order], 'months': month_range}
+        for name in self.names:
+            result[name] = self.sums[name][order]
+        return result
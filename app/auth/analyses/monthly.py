@@ -0,0 +1,151 @@
+# Imports
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Local Imports
+from ...metrics import stage, timed_iter
+from ..schema import analysis_columns
+from ..uploads.sidecar import load_sidecar, part_count
+from ..utilities import iter_chunks, load_date_range
+from .aggregate import segment_month_sums, SegmentMonthSums
+
+
+def month_end(months):
+    """
+    Convert numpy month values to month end dates, matching resample('M') labels
+    """
+    months = np.asarray(months, dtype='datetime64[M]')
+    return (months + np.timedelta64(1, 'M')).astype('datetime64[D]') - np.timedelta64(1, 'D')
+
+
+def profit_split(df):
+    """
+    Sales split into profitable and unprofitable amounts
+    """
+    sales = np.asarray(df['Sales'], dtype=np.float64)
+    profit = np.asarray(df['Profit'], dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        return {'profitable': np.where(profit > 0, sales, 0),
+                'unprofitable': np.where(profit <= 0, sales, 0)}
+
+
+def segment_monthly_sales(df):
+    """
+    Sum profitable and unprofitable sales by customer segment and month.
+    Returns the segments, the months they span and one row of monthly
+    totals per segment for each series.
+    """
+    return segment_month_sums(df['Customer Segment'], df['Order Date'], profit_split(df))
+
+
+def stream_segment_monthly_sales(file, file_type, chunksize, profile=None):
+    """
+    Same totals as segment_monthly_sales, read from a CSV/TSV file or XLSX
+    sheet one chunk at a time so only one chunk and the running totals are
+    in memory
+    """
+    sums = SegmentMonthSums(['profitable', 'unprofitable'])
+    chunks = iter_chunks(file, file_type, chunksize, columns=analysis_columns('segment_area'),
+                         parse_dates=True, profile=profile)
+    for chunk in timed_iter(chunks, 'parse'):
+        with stage('aggregate'):
+            sums.add(chunk['Customer Segment'], chunk['Order Date'], profit_split(chunk))
+    return sums.result()
+
+
+def cached_segment_monthly_sales(file):
+    """
+    Same totals as segment_monthly_sales, read from the column cache one part
+    at a time in the order the parts were stored; the sums do not depend on
+    the order of the rows. Returns None if the file has no up to date cache.
+    """
+    parts = part_count(file)
+    if parts is None:
+        return None
+    sums = SegmentMonthSums(['profitable', 'unprofitable'])
+    for part in range(parts):
+        with stage('parse'):
+            chunk = load_sidecar(file, analysis_columns('segment_area'), part=part)
+        if chunk is None:
+            # the cache was replaced while it was read
+            return None
+        with stage('aggregate'):
+            sums.add(chunk['Customer Segment'], chunk['Order Date'], profit_split(chunk))
+    return sums.result()
+
+
+def range_monthly(file, file_type, start=None, end=None, profile=None):
+    """
+    Same totals as segment_monthly_sales over only the orders placed in
+    [start, end), read through the date order of the column cache
+    """
+    df = load_date_range(file, file_type, 'Order Date', start, end,
+                         columns=analysis_columns('segment_area'), profile=profile)
+    return segment_monthly_sales(df)
+
+
+def merge_monthly(monthly, added):
+    """
+    Aggregates of a file after rows aggregated into added were appended to it
+    """
+    sums = SegmentMonthSums(['profitable', 'unprofitable'])
+    sums.merge(monthly)
+    sums.merge(added)
+    return sums.result()
+
+
+def save_monthly(path, monthly):
+    """
+    Store aggregates computed by segment_monthly_sales
+    """
+    # write under a temporary name of its own so readers never load a partial
+    # file and jobs saving the same aggregates do not write into each other's
+    tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **monthly)
+    os.rename(tmp_path, path)
+
+
+def load_monthly(path):
+    """
+    Load aggregates stored by save_monthly
+    """
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def load_segments(path):
+    """
+    Only the segment names of stored aggregates
+    """
+    with np.load(path) as data:
+        return [str(segment) for segment in data['segments']]
+
+
+def segment_frame(monthly, segment):
+    """
+    Monthly profitable / unprofitable sales of one segment, ready for charting
+    """
+    position = list(monthly['segments']).index(segment)
+    return pd.DataFrame({'Profitable': monthly['profitable'][position],
+                         'Unprofitable': monthly['unprofitable'][position]},
+                        index=pd.DatetimeIndex(month_end(monthly['months']), name='Order Date'),
+                        columns=['Profitable', 'Unprofitable'])
+
+
+def monthly_series(monthly, segments=None):
+    """
+    Monthly totals of the given segments, or of all of them, as plain lists
+    for JSON; amounts are rounded to cents. Segments without orders are left
+    out, so a time range can have none of the given ones.
+    """
+    available = [str(segment) for segment in monthly['segments']]
+    chosen = [segment for segment in available if not segments or segment in segments]
+    positions = [available.index(segment) for segment in chosen]
+    return {'segments': chosen,
+            'months': [str(month) for month in monthly['months']],
+            'profitable': np.round(monthly['profitable'][positions], 2).tolist(),
+            'unprofitable': np.round(monthly['unprofitable'][positions], 2).tolist()}
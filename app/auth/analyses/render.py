@@ -0,0 +1,162 @@
+# Imports
+import os
+
+from bokeh.charts import Area
+from bokeh.embed import components
+from bokeh.layouts import gridplot
+from bokeh.models import NumeralTickFormatter
+from bokeh.resources import CDN
+
+# Local Imports
+from ...metrics import stage
+from ..schema import analysis_columns
+from ..uploads.profile import profile_upload, merge_profile
+from ..uploads.sidecar import has_sidecar, append_sidecar
+from ..uploads.storage import makedirs
+from ..utilities import cache_columns, load_cached_df, read_file
+from .monthly import (segment_monthly_sales, stream_segment_monthly_sales, cached_segment_monthly_sales, range_monthly,
+                      merge_monthly, save_monthly, load_monthly, segment_frame)
+
+# These functions run in job workers, so they only take plain arguments
+# and work with files, never with the database or the request.
+
+
+def build_monthly(source_file, file_type, analysis_file, chunk_threshold=None, chunksize=100000,
+                  profile=None):
+    """
+    Compute and store the monthly segment aggregates of a source file.
+    Files larger than chunk_threshold bytes are converted to the column cache
+    in chunks, then summed from the cache a part at a time; profile holds the
+    load options recorded for the file at upload.
+    """
+    makedirs(os.path.dirname(analysis_file))
+    monthly = cached_segment_monthly_sales(source_file)
+    if monthly is None and chunk_threshold is not None and os.path.getsize(source_file) > chunk_threshold:
+        with stage('cache'):
+            cached = cache_columns(source_file, file_type, chunksize, profile=profile)
+        monthly = cached_segment_monthly_sales(source_file) if cached else None
+        if monthly is None:
+            monthly = stream_segment_monthly_sales(source_file, file_type, chunksize, profile)
+    elif monthly is None:
+        with stage('parse'):
+            df = load_cached_df(source_file, file_type, columns=analysis_columns('segment_area'), profile=profile)
+        with stage('aggregate'):
+            monthly = segment_monthly_sales(df)
+    with stage('save'):
+        save_monthly(analysis_file, monthly)
+    return analysis_file
+
+
+def build_range_monthly(source_file, file_type, start, end, range_file, profile=None):
+    """
+    Compute and store the monthly segment aggregates of only the orders placed
+    in [start, end), for the requests after this job to load
+    """
+    makedirs(os.path.dirname(range_file))
+    with stage('load_range'):
+        monthly = range_monthly(source_file, file_type, start, end, profile=profile)
+    with stage('save'):
+        save_monthly(range_file, monthly)
+    return range_file
+
+
+def ingest_upload(source_file, file_type, analysis_file, build=True, columnar=False, **build_options):
+    """
+    Profile a new upload, then build its aggregates with the recorded load
+    options. With columnar, XLSX sheets are also converted once, a chunk at a
+    time, to the column cache that later loads memory map. Returns the profile
+    for the caller to store.
+    """
+    with stage('profile'):
+        profile = profile_upload(source_file, file_type, build_options.get('chunksize', 100000))
+    if columnar and file_type == 'xlsx' and not has_sidecar(source_file):
+        with stage('parse'):
+            cache_columns(source_file, file_type, build_options.get('chunksize', 100000), profile=profile)
+    if build:
+        build_options['profile'] = profile
+        build_monthly(source_file, file_type, analysis_file, **build_options)
+    return profile
+
+
+def append_analysis(source_file, file_type, start, previous_file, analysis_file, profile, source=None,
+                    keep_previous=True, **build_options):
+    """
+    Bring the aggregates and column cache of a source file up to date after
+    rows were appended to it from byte offset start, reading only those rows.
+    profile is the one stored before the append, with its row count and date
+    range; source is passed on to append_sidecar. Files that were never
+    profiled or aggregated are ingested in full instead.
+    Returns the profile of the whole file for the caller to store.
+    """
+    if profile is None or not os.path.exists(previous_file):
+        return ingest_upload(source_file, file_type, analysis_file, **build_options)
+    with stage('profile'):
+        profile = merge_profile(profile, profile_upload(source_file, file_type,
+                                                        build_options.get('chunksize', 100000), start=start))
+    with stage('parse'):
+        df = read_file(source_file, file_type, parse_dates=True, profile=profile, start=start)
+    if source is not None:
+        with stage('cache'):
+            append_sidecar(source_file, df, source)
+    with stage('aggregate'):
+        monthly = merge_monthly(load_monthly(previous_file), segment_monthly_sales(df))
+    with stage('save'):
+        save_monthly(analysis_file, monthly)
+    if not keep_previous and previous_file != analysis_file:
+        os.remove(previous_file)
+    return profile
+
+
+def segment_area_chart(monthly, segment, plot_width, plot_height):
+    """
+    Stacked profitable / unprofitable area chart of one segment
+    """
+    cons_df_area = segment_frame(monthly, segment)
+
+    # When adding stack=True, Y labels skew.  Fixed with NumeralTickFormatter
+    cons_area = Area(cons_df_area, title=segment, legend="top_left",
+                xlabel='', ylabel='Sales', plot_width=plot_width, plot_height=plot_height,
+                stack=True, color=['#3288bd', '#99d594'],
+                    )
+    cons_area.yaxis[0].formatter = NumeralTickFormatter(format="0,00")
+    return cons_area
+
+
+def render_segment_areas(analysis_file, source_file, file_type, segments=None, plot_width=700, plot_height=400,
+                         ncols=2, date_range=None, **build_options):
+    """
+    Render the area charts of the given segments, or of every segment, from one
+    set of aggregates as a script and div to embed in a page, building the
+    aggregates first if they are missing. Several charts are laid out in a grid.
+    With a (start, end) date_range only the orders placed in it are charted.
+    Raises ValueError for segments the aggregates do not have.
+    """
+    if date_range is not None:
+        with stage('load_range'):
+            monthly = range_monthly(source_file, file_type, date_range[0], date_range[1],
+                                    profile=build_options.get('profile'))
+    else:
+        if not os.path.exists(analysis_file):
+            build_monthly(source_file, file_type, analysis_file, **build_options)
+        with stage('load_aggregates'):
+            monthly = load_monthly(analysis_file)
+
+    available = [str(segment) for segment in monthly['segments']]
+    if segments and date_range is None and not set(segments) <= set(available):
+        raise ValueError('Unknown segments: {}'.format(', '.join(sorted(set(segments) - set(available)))))
+    chosen = [segment for segment in available if not segments or segment in segments]
+    if not chosen:
+        return '<p>There are no orders in this time range.</p>'
+    with stage('bokeh_models'):
+        charts = [segment_area_chart(monthly, segment, plot_width, plot_height) for segment in chosen]
+        layout = charts[0] if len(charts) == 1 else gridplot(charts, ncols=ncols)
+    with stage('embed'):
+        script, div = components(layout)
+    return script + div
+
+
+def chart_resources():
+    """
+    BokehJS script and style tags for pages embedding rendered charts
+    """
+    return CDN.render_js() + CDN.render_css()
@@ -0,0 +1,77 @@
+# Imports
+import importlib
+
+# The upload and analysis code imports pandas, numpy, openpyxl and Bokeh.
+# Views reach it through the lazy functions below so that a worker only
+# pays for those imports when it first handles an upload or an analysis;
+# prefork servers can call preload() once in the master instead.
+
+class LazyFunction(object):
+    """
+    Stand-in for a function that imports its module on first call. It
+    pickles by name, so it can be handed to job worker processes.
+    """
+
+    def __init__(self, module, name):
+        self.module = module
+        self.__name__ = name
+        self.function = None
+
+    def resolve(self):
+        if self.function is None:
+            module = importlib.import_module('.' + self.module, __package__)
+            self.function = getattr(module, self.__name__)
+        return self.function
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __reduce__(self):
+        return LazyFunction, (self.module, self.__name__)
+
+    def __repr__(self):
+        return '<lazy {}.{}>'.format(self.module, self.__name__)
+
+
+def preload():
+    """
+    Import the whole analysis stack now, e.g. in a prefork master so that
+    workers share it copy-on-write
+    """
+    for function in list(globals().values()):
+        if isinstance(function, LazyFunction):
+            function.resolve()
+
+
+# Upload handling
+detect_file_type = LazyFunction('uploads.file_validate', 'detect_file_type')
+has_valid_headers = LazyFunction('uploads.file_validate', 'has_valid_headers')
+file_sha256 = LazyFunction('uploads.ingest', 'file_sha256')
+load_row_index = LazyFunction('uploads.row_index', 'load_row_index')
+build_row_index = LazyFunction('uploads.row_index', 'build_row_index')
+remove_row_index = LazyFunction('uploads.row_index', 'remove_row_index')
+has_date_order = LazyFunction('uploads.sidecar', 'has_date_order')
+remove_sidecar = LazyFunction('uploads.sidecar', 'remove_sidecar')
+store_upload = LazyFunction('uploads.storage', 'store_upload')
+append_upload = LazyFunction('uploads.storage', 'append_upload')
+is_stored = LazyFunction('uploads.storage', 'is_stored')
+release = LazyFunction('uploads.storage', 'release')
+archive_members = LazyFunction('uploads.bulk', 'archive_members')
+store_members = LazyFunction('uploads.bulk', 'store_members')
+
+# Loading and previews
+create_df = LazyFunction('utilities', 'create_df')
+create_df_with_parse_date = LazyFunction('utilities', 'create_df_with_parse_date')
+create_preview = LazyFunction('utilities', 'create_preview')
+load_date_range = LazyFunction('utilities', 'load_date_range')
+
+# Analyses
+load_segments = LazyFunction('analyses.monthly', 'load_segments')
+load_monthly = LazyFunction('analyses.monthly', 'load_monthly')
+monthly_series = LazyFunction('analyses.monthly', 'monthly_series')
+range_monthly = LazyFunction('analyses.monthly', 'range_monthly')
+build_range_monthly = LazyFunction('analyses.render', 'build_range_monthly')
+ingest_upload = LazyFunction('analyses.render', 'ingest_upload')
+append_analysis = LazyFunction('analyses.render', 'append_analysis')
+render_segment_areas = LazyFunction('analyses.render', 'render_segment_areas')
+chart_resources = LazyFunction('analyses.render', 'chart_resources')
@@ -45,3 +45,12 @@ class UploadForm(FlaskForm):
 
     file = FileField('Select File')
     submit = SubmitField('Submit')
+
+
+class BulkUploadForm(FlaskForm):
+    """
+    Form for users to upload several spreadsheets or a zip archive of them
+    """
+
+    files = FileField('Select Files or a Zip Archive', render_kw={'multiple': True})
+    submit = SubmitField('Submit')
@@ -0,0 +1,48 @@
+# Column types of the store data schema
+DATE_COLUMNS = ['Ship Date', 'Order Date']
+# low cardinality text, stored as categoricals
+CATEGORY_COLUMNS = ['Order Priority', 'Ship Mode', 'Customer Segment', 'Product Category',
+                    'Product Sub-Category', 'Product Container', 'Country', 'Region',
+                    'State or Province']
+# amounts that get summed keep full precision
+MEASURE_COLUMNS = ['Profit', 'Sales']
+FLOAT_COLUMNS = ['Discount', 'Unit Price', 'Shipping Cost', 'Product Base Margin']
+INTEGER_COLUMNS = ['Row ID', 'Customer ID', 'Postal Code', 'Quantity ordered new', 'Order ID']
+
+# Columns each analysis reads
+ANALYSES = {
+    'segment_area': ['Order Date', 'Customer Segment', 'Profit', 'Sales'],
+}
+
+# Columns an upload must have to be accepted
+# we need to change this if we later enable other analyses
+REQUIRED_COLUMNS = ['Order Date', 'Customer Segment', 'Profit', 'Sales', 'Product Category']
+
+
+def analysis_columns(analysis):
+    return list(ANALYSES[analysis])
+
+
+def read_dtypes(columns):
+    """
+    dtype argument for read_csv covering the given columns
+    """
+    return dict((column, 'category') for column in columns if column in CATEGORY_COLUMNS)
+
+
+def compact(df):
+    """
+    Shrink a loaded data frame: low cardinality text to categoricals and
+    numbers to the smallest type that holds them
+    """
+    import pandas as pd
+
+    for column in df.columns:
+        kind = df[column].dtype.kind
+        if column in CATEGORY_COLUMNS and df[column].dtype.name != 'category':
+            df[column] = df[column].astype('category')
+        elif column in INTEGER_COLUMNS and kind in 'iuf':
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+        elif column in FLOAT_COLUMNS and kind == 'f':
+            df[column] = pd.to_numeric(df[column], downcast='float')
+    return df
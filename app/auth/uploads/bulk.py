@@ -0,0 +1,85 @@
+# Imports
+from concurrent.futures import ThreadPoolExecutor
+import os
+import zipfile
+
+from werkzeug.utils import secure_filename
+
+# Local Imports
+from .ingest import ROW_INDEX_STEP
+from .storage import store_upload
+
+# File types accepted in a bulk upload, by extension
+FILE_TYPES = {'.csv': 'csv', '.tsv': 'tsv', '.xlsx': 'xlsx'}
+
+
+def extension_type(filename):
+    """
+    File type of a bulk upload member from its extension, or None
+    """
+    return FILE_TYPES.get(os.path.splitext(filename)[1].lower())
+
+
+def archive_members(stream, max_files=None, max_member_bytes=None, max_bytes=None):
+    """
+    (name, opener) pairs for the files of a zip archive, skipping folders and
+    the metadata files some archivers add. Archives with more than max_files
+    files, a file larger than max_member_bytes or more than max_bytes in all
+    once extracted are refused before anything is read from them.
+    """
+    archive = zipfile.ZipFile(stream)
+    members = []
+    total = 0
+    for info in archive.infolist():
+        name = os.path.basename(info.filename)
+        if info.filename.endswith('/') or not name or name.startswith('.') or '__MACOSX' in info.filename:
+            continue
+        members.append((name, lambda info=info: archive.open(info)))
+        if max_files is not None and len(members) > max_files:
+            raise ValueError('archives may hold at most {} files'.format(max_files))
+        # zipfile stops reading a member at its recorded size, so the sizes can be trusted
+        if max_member_bytes is not None and info.file_size > max_member_bytes:
+            raise ValueError('{} is larger than {} bytes once extracted'.format(name, max_member_bytes))
+        total += info.file_size
+        if max_bytes is not None and total > max_bytes:
+            raise ValueError('archives may hold at most {} bytes once extracted'.format(max_bytes))
+    return members
+
+
+def store_member(name, opener, folder, header_list, index_step):
+    """
+    Validate and store one member; returns a report entry with the upload
+    info of accepted files under 'upload'
+    """
+    filename = secure_filename(name)
+    entry = {'name': filename, 'status': None, 'message': None, 'upload': None}
+    file_type = extension_type(filename)
+    if file_type is None:
+        entry.update(status='unsupported', message='Not a CSV, TSV, or Excel file.')
+        return entry
+    try:
+        stream = opener()
+        try:
+            upload, duplicate = store_upload(stream, folder, file_type, header_list, index_step=index_step)
+        finally:
+            stream.close()
+    except Exception as e:
+        entry.update(status='error', message=str(e))
+        return entry
+    if not upload.valid:
+        entry.update(status='invalid', message='Missing headers: {}'.format(
+            ', '.join(header for header in header_list if header not in (upload.headers or []))))
+        return entry
+    entry.update(status='uploaded', upload=upload, file_type=file_type)
+    return entry
+
+
+def store_members(members, folder, header_list, index_step=ROW_INDEX_STEP, workers=4):
+    """
+    Validate, hash and store the (name, opener) members concurrently.
+    Returns one report entry per member, in order.
+    """
+    with ThreadPoolExecutor(max(1, workers)) as pool:
+        futures = [pool.submit(store_member, name, opener, folder, header_list, index_step)
+                   for name, opener in members]
+        return [future.result() for future in futures]
@@ -1,6 +1,8 @@
 from mimetypes import MimeTypes
 import pandas as pd
 
+from ..utilities import iter_xlsx_rows
+
 
 def detect_file_type(file):
     """
@@ -16,16 +18,26 @@ def detect_file_type(file):
     return file_type
 
 
-def has_valid_headers(file, file_type, header_list):
-    # this is a file obejct, it assumes a file path
+def read_headers(file, file_type):
+    """
+    Read only the header row of a file path or file object
+    """
     if file_type == 'csv':
-        # print(pd.read_csv(file))
-        headers = pd.read_csv(file, encoding='ISO-8859-1').columns.values.tolist()
+        headers = pd.read_csv(file, encoding='ISO-8859-1', nrows=0).columns.values.tolist()
     elif file_type == 'tsv':
-        headers = pd.read_csv(file, encoding='ISO-8859-1', sep='\t').columns.values.tolist()
+        headers = pd.read_csv(file, encoding='ISO-8859-1', sep='\t', nrows=0).columns.values.tolist()
     elif file_type == 'xlsx':
-        headers = pd.read_excel(file, encoding='ISO-8859-1').columns.values.tolist()
+        headers = list(iter_xlsx_rows(file, 1, 1))[0]
+    return headers
+
+
+def headers_match(headers, header_list):
     for header in header_list:
         if header not in headers:
             return False
     return True
+
+
+def has_valid_headers(file, file_type, header_list):
+    # this is a file obejct, it assumes a file path
+    return headers_match(read_headers(file, file_type), header_list)
@@ -0,0 +1,103 @@
+# Imports
+import csv
+import hashlib
+import os
+from collections import namedtuple
+
+# Local Imports
+from ..utilities import iter_xlsx_rows
+from .file_validate import headers_match
+from .row_index import RowIndexer
+
+# Size of each read from the upload stream
+CHUNK_SIZE = 1024 * 1024
+
+# Rows between entries of the byte offset index of CSV/TSV uploads
+ROW_INDEX_STEP = 1000
+
+UploadInfo = namedtuple('UploadInfo', ['path', 'sha256', 'size', 'rows', 'headers', 'valid', 'row_offsets'])
+
+
+def parse_header_line(line, file_type):
+    """
+    Split the first line of a CSV/TSV file into column names
+    """
+    delimiter = '\t' if file_type == 'tsv' else ','
+    text = line.decode('ISO-8859-1').rstrip('\r\n')
+    return next(csv.reader([text], delimiter=delimiter))
+
+
+def file_sha256(file_path, chunk_size=CHUNK_SIZE):
+    """
+    Hash a saved file, for uploads stored before hashes were recorded
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def stream_upload(stream, file_path, file_type, header_list, chunk_size=CHUNK_SIZE,
+                  index_step=ROW_INDEX_STEP):
+    """
+    Copy an upload stream to disk in one pass, checking the headers from the
+    first line and computing the content hash, row count and, for CSV/TSV,
+    the byte offset of every index_step-th row on the way.
+    The file is only moved to file_path when the headers are valid.
+    """
+    tmp_path = file_path + '.part'
+    sha256 = hashlib.sha256()
+    size = 0
+    indexer = RowIndexer(index_step)
+    first_line = b''
+    headers = None
+    last_byte = b''
+
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                out.write(chunk)
+                sha256.update(chunk)
+                size += len(chunk)
+                last_byte = chunk[-1:]
+
+                if file_type == 'xlsx':
+                    continue
+                indexer.feed(chunk)
+                if headers is None:
+                    first_line += chunk
+                    if b'\n' in first_line:
+                        headers = parse_header_line(first_line.split(b'\n', 1)[0], file_type)
+                        first_line = b''
+                        if not headers_match(headers, header_list):
+                            # stop reading, the rest of the body is of no use
+                            break
+
+        if file_type == 'xlsx':
+            # the sheet can only be opened once the whole zip archive is on disk
+            rows = 0
+            for row in iter_xlsx_rows(tmp_path):
+                if headers is None:
+                    headers = row
+                elif any(value is not None for value in row):
+                    rows += 1
+        else:
+            if headers is None:
+                headers = parse_header_line(first_line, file_type) if first_line else []
+            # count a final line that has no trailing newline, less the header
+            rows = max(0, indexer.newlines + (1 if last_byte not in (b'', b'\n') else 0) - 1)
+
+        valid = headers_match(headers or [], header_list)
+        if valid:
+            os.rename(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return UploadInfo(path=file_path, sha256=sha256.hexdigest(), size=size,
+                      rows=rows if valid else None, headers=headers, valid=valid,
+                      row_offsets=indexer.result() if valid and file_type != 'xlsx' else None)
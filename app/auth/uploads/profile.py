@@ -0,0 +1,143 @@
+# Imports
+import csv
+from datetime import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+# Local Imports
+from ..schema import DATE_COLUMNS
+from ..utilities import iter_csv_from, iter_xlsx_chunks
+
+# Date formats tried, in order, when profiling a file
+DATE_FORMATS = ['%m/%d/%y', '%m/%d/%Y', '%Y-%m-%d', '%d/%m/%Y', '%d/%m/%y', '%Y/%m/%d',
+                '%m-%d-%Y', '%d-%m-%Y', '%d.%m.%Y']
+
+# Bytes read from the top of a file to detect its encoding and delimiter
+SAMPLE_BYTES = 64 * 1024
+
+
+def detect_encoding(sample):
+    """
+    UTF-8 when the sample decodes as such, otherwise the Latin-1 the loaders always assumed
+    """
+    try:
+        # a multi-byte character may be cut at the end of the sample
+        sample.decode('utf-8')
+    except UnicodeDecodeError as e:
+        if e.start < len(sample) - 3:
+            return 'ISO-8859-1'
+    return 'utf-8'
+
+
+def detect_delimiter(header_line, file_type):
+    try:
+        return csv.Sniffer().sniff(header_line, delimiters=',\t;|').delimiter
+    except csv.Error:
+        return '\t' if file_type == 'tsv' else ','
+
+
+def detect_date_format(values):
+    """
+    First format that parses every sampled value, or None
+    """
+    values = [value.strip() for value in values if isinstance(value, str) and value.strip()]
+    if not values:
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            for value in values:
+                datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+        return date_format
+    return None
+
+
+def merge_dtype(known, dtype):
+    """
+    Type that holds values of both dtypes, the way read_csv would infer it
+    """
+    if known is None:
+        return dtype
+    if known == dtype:
+        return known
+    if known.kind in 'biuf' and dtype.kind in 'biuf':
+        return np.promote_types(known, dtype)
+    return np.dtype(object)
+
+
+def profile_upload(file, file_type, chunksize=100000, sample_rows=1000, start=None):
+    """
+    Describe an upload in one pass over it: row count, size, column dtypes,
+    encoding, delimiter, date format and the range of order dates. With start,
+    rows, dtypes and dates only describe the CSV/TSV rows from that byte
+    offset on, for merge_profile.
+    """
+    profile = {'size': os.path.getsize(file), 'delimiter': None, 'encoding': None,
+               'date_format': None, 'min_date': None, 'max_date': None}
+
+    if file_type == 'xlsx':
+        chunks = iter_xlsx_chunks(file, chunksize)
+    else:
+        with open(file, 'rb') as f:
+            sample = f.read(SAMPLE_BYTES)
+        profile['encoding'] = detect_encoding(sample)
+        header_line = sample.split(b'\n', 1)[0].decode(profile['encoding'], 'replace')
+        profile['delimiter'] = detect_delimiter(header_line, file_type)
+
+        # dates are read as text here; the format is detected from the first rows
+        head = pd.read_csv(file, encoding=profile['encoding'], sep=profile['delimiter'],
+                           nrows=sample_rows, dtype=dict((column, object) for column in DATE_COLUMNS))
+        formats = [detect_date_format(head[column].tolist()) for column in DATE_COLUMNS if column in head]
+        if formats and all(date_format == formats[0] for date_format in formats):
+            profile['date_format'] = formats[0]
+        options = {'chunksize': chunksize, 'dtype': dict((column, object) for column in DATE_COLUMNS)}
+        if start is None:
+            chunks = pd.read_csv(file, encoding=profile['encoding'], sep=profile['delimiter'], **options)
+        else:
+            chunks = iter_csv_from(file, start, profile['encoding'], profile['delimiter'], **options)
+
+    rows = 0
+    dtypes = {}
+    columns = []
+    first, last = None, None
+    for chunk in chunks:
+        rows += len(chunk)
+        columns = chunk.columns.values.tolist()
+        for column in columns:
+            if column not in DATE_COLUMNS:
+                dtypes[column] = merge_dtype(dtypes.get(column), chunk[column].dtype)
+        if 'Order Date' in chunk:
+            dates = pd.to_datetime(chunk['Order Date'], format=profile['date_format'], errors='coerce')
+            if dates.notnull().any():
+                first = dates.min() if first is None else min(first, dates.min())
+                last = dates.max() if last is None else max(last, dates.max())
+
+    profile['rows'] = rows
+    profile['dtypes'] = dict((column, 'datetime64[ns]' if column in DATE_COLUMNS else dtypes[column].name)
+                             for column in columns)
+    profile['min_date'] = None if first is None else first.to_pydatetime()
+    profile['max_date'] = None if last is None else last.to_pydatetime()
+    return profile
+
+
+def merge_profile(profile, added):
+    """
+    Profile of a file after rows were appended to it, from the profile taken
+    before and the one of the appended rows
+    """
+    merged = dict(profile)
+    merged['rows'] = (profile.get('rows') or 0) + added['rows']
+    merged['size'] = added['size']
+    dtypes = dict(profile['dtypes'])
+    for column, dtype in added['dtypes'].items():
+        known = np.dtype(dtypes[column]) if column in dtypes else None
+        dtypes[column] = merge_dtype(known, np.dtype(dtype)).name
+    merged['dtypes'] = dtypes
+    firsts = [date for date in (profile.get('min_date'), added['min_date']) if date is not None]
+    lasts = [date for date in (profile.get('max_date'), added['max_date']) if date is not None]
+    merged['min_date'] = min(firsts) if firsts else None
+    merged['max_date'] = max(lasts) if lasts else None
+    return merged
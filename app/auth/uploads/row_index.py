@@ -0,0 +1,87 @@
+# Imports
+import os
+
+import numpy as np
+
+ROW_INDEX_SUFFIX = '.rows.npz'
+
+
+class RowIndexer(object):
+    """
+    Records the byte offset of every step-th data row of a CSV/TSV file as
+    its bytes stream past, so a page of rows can later be read with a seek.
+    Indexing of a file that grows is carried on by starting at its size and
+    newline count.
+    """
+
+    def __init__(self, step, position=0, newlines=0):
+        self.step = step
+        self.position = position
+        self.newlines = newlines
+        self.offsets = []
+
+    def feed(self, chunk):
+        positions = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == ord('\n'))
+        # newline n ends line n, so data row n starts right after it
+        numbers = self.newlines + np.arange(len(positions))
+        self.offsets.append(positions[numbers % self.step == 0] + self.position + 1)
+        self.newlines += len(positions)
+        self.position += len(chunk)
+
+    def result(self):
+        if not self.offsets:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(self.offsets).astype(np.int64)
+
+
+def row_index_path(file):
+    return file + ROW_INDEX_SUFFIX
+
+
+def save_row_index(file, step, offsets):
+    tmp_path = row_index_path(file) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, step=np.int64(step), offsets=offsets)
+    os.rename(tmp_path, row_index_path(file))
+
+
+def build_row_index(file, step, chunk_size=1024 * 1024):
+    """
+    Index a saved file, for uploads stored before row indexes were built
+    """
+    indexer = RowIndexer(step)
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            indexer.feed(chunk)
+    offsets = indexer.result()
+    save_row_index(file, step, offsets)
+    return step, offsets
+
+
+def load_row_index(file):
+    """
+    The step and row offsets of a file, or None if it has no index
+    """
+    try:
+        with np.load(row_index_path(file)) as data:
+            return int(data['step']), data['offsets']
+    except (IOError, OSError, KeyError):
+        return None
+
+
+def remove_row_index(file):
+    try:
+        os.remove(row_index_path(file))
+    except OSError:
+        pass
+
+
+def seek_row(row_index, row):
+    """
+    Byte offset to start reading from and how many rows to skip after it to reach row
+    """
+    step, offsets = row_index
+    block = min(row // step, len(offsets) - 1)
+    if block < 0:
+        return None
+    return int(offsets[block]), row - block * step
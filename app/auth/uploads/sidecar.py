@@ -0,0 +1,337 @@
+# Imports
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout changes so old sidecars get rebuilt
+SIDECAR_VERSION = 3
+SIDECAR_SUFFIX = '.cols'
+META_FILE = 'meta.json'
+
+
+def sidecar_path(file):
+    """
+    Directory holding the column files for an upload
+    """
+    return file + SIDECAR_SUFFIX
+
+
+def source_stamp(file):
+    """
+    Size and modification time of the source file, used to detect changes
+    """
+    stat = os.stat(file)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def sort_order(values):
+    """
+    Positions that put datetime values in order the way sort_values does,
+    missing dates last, along with the sorted dates that are not missing
+    """
+    values = np.asarray(values, dtype='datetime64[ns]')
+    # NaT is stored as the smallest int64
+    valid = values.view(np.int64) != np.iinfo(np.int64).min
+    positions = np.flatnonzero(valid)
+    order = positions[np.argsort(values[valid], kind='quicksort')]
+    return np.concatenate([order, np.flatnonzero(~valid)]).astype(np.int64), values[order]
+
+
+def save_sort_order(path, entry, position, values, first_row=0, part=None):
+    # the order of a part refers to rows of the whole sidecar, counted from first_row
+    order, dates = sort_order(values)
+    suffix = '' if part is None else '.{}'.format(part)
+    names = ['{}.order{}.npy'.format(position, suffix), '{}.sorted{}.npy'.format(position, suffix)]
+    np.save(os.path.join(path, names[0]), order + first_row)
+    np.save(os.path.join(path, names[1]), dates)
+    return entry.get('order', []) + names[:1], entry.get('sorted', []) + names[1:]
+
+
+def write_sidecar(file, df):
+    """
+    Store a parsed data frame next to its source file, one .npy file per column.
+    Text columns are stored as integer codes plus a small table of unique values
+    so that every column can be memory mapped on load. Rows appended later are
+    stored as further parts of each column. Date columns also get the order
+    that sorts each part and the sorted dates, for date_rows.
+    """
+    write_sidecar_chunks(file, [df])
+
+
+def write_sidecar_chunks(file, chunks):
+    """
+    Same as write_sidecar for a file parsed one chunk of rows at a time: every
+    chunk after the first is stored as one more part, so only one chunk is in
+    memory. Returns whether the sidecar was written; none is left behind when
+    a chunk changes the type of a column.
+    """
+    path = sidecar_path(file)
+    # each builder writes its own directory; several jobs may cache the same content at once
+    tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+    os.makedirs(tmp_path)
+
+    meta = None
+    for df in chunks:
+        if meta is None:
+            meta = write_columns(tmp_path, df)
+        elif not append_part(tmp_path, meta, df):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return False
+    if meta is None:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return False
+    meta['source'] = source_stamp(file)
+    write_meta(tmp_path, meta)
+
+    # swap the finished directory into place so readers never see a partial sidecar
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        if not has_sidecar(file):
+            # an outdated sidecar is in the way
+            shutil.rmtree(path, ignore_errors=True)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                pass
+        # otherwise another builder finished first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        return has_sidecar(file)
+    return True
+
+
+def write_columns(path, df):
+    # first part of every column; returns the description without the source stamp
+    columns = []
+    for position, name in enumerate(df.columns):
+        values = np.asarray(df[name])
+        entry = {'name': name, 'data': ['{}.npy'.format(position)]}
+        if values.dtype.kind == 'O':
+            codes, uniques = pd.factorize(values)
+            np.save(os.path.join(path, entry['data'][0]), codes.astype(np.int32))
+            entry['categories'] = '{}.cat.npy'.format(position)
+            np.save(os.path.join(path, entry['categories']), np.asarray(uniques, dtype=object))
+        else:
+            np.save(os.path.join(path, entry['data'][0]), values)
+            if values.dtype.kind == 'M':
+                entry['order'], entry['sorted'] = save_sort_order(path, entry, position, values)
+        columns.append(entry)
+    # frames without rows come with an object index, which cannot be memory mapped
+    np.save(os.path.join(path, 'index.npy'), np.asarray(df.index) if len(df) else np.zeros(0, dtype=np.int64))
+    return {'version': SIDECAR_VERSION, 'rows': len(df), 'index': ['index.npy'], 'columns': columns}
+
+
+def write_meta(path, meta):
+    # replace the description atomically; it is what makes new parts visible
+    with open(os.path.join(path, META_FILE + '.tmp'), 'w') as f:
+        json.dump(meta, f)
+    os.rename(os.path.join(path, META_FILE + '.tmp'), os.path.join(path, META_FILE))
+
+
+def read_meta(path):
+    with open(os.path.join(path, META_FILE)) as f:
+        return json.load(f)
+
+
+def load_parts(path, parts, rows=None):
+    # one part is memory mapped as is, several are joined; with rows only
+    # those positions are read, from whichever part holds them
+    values = [np.load(os.path.join(path, part), mmap_mode='r') for part in parts]
+    if rows is None:
+        return values[0] if len(values) == 1 else np.concatenate(values)
+    if len(values) == 1:
+        return values[0][rows]
+    bounds = np.cumsum([0] + [len(value) for value in values])
+    numbers = np.searchsorted(bounds, rows, side='right') - 1
+    result = np.empty(len(rows), dtype=np.result_type(*values))
+    for number, value in enumerate(values):
+        chosen = numbers == number
+        result[chosen] = value[rows[chosen] - bounds[number]]
+    return result
+
+
+def has_sidecar(file):
+    """
+    Whether an up to date sidecar exists for an upload
+    """
+    try:
+        meta = read_meta(sidecar_path(file))
+        return meta.get('version') == SIDECAR_VERSION and meta['source'] == source_stamp(file)
+    except (IOError, OSError, ValueError, KeyError):
+        return False
+
+
+def part_count(file):
+    """
+    Number of parts the columns of an up to date sidecar are stored in, or None
+    """
+    try:
+        meta = read_meta(sidecar_path(file))
+        if meta.get('version') != SIDECAR_VERSION or meta['source'] != source_stamp(file):
+            return None
+        return len(meta['index'])
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+
+def load_sidecar(file, columns=None, rows=None, part=None):
+    """
+    Load the data frame stored for an upload, or only the given columns of it,
+    or only the rows at the given positions, in that order, or only the rows
+    of one part, in the order they were stored.
+    Returns None if there is no sidecar or the source file has changed since
+    it was written.
+    """
+    path = sidecar_path(file)
+    try:
+        meta = read_meta(path)
+        if meta.get('version') != SIDECAR_VERSION or meta['source'] != source_stamp(file):
+            return None
+
+        entries = meta['columns']
+        if columns is not None:
+            entries = [entry for entry in entries if entry['name'] in columns]
+            if len(entries) != len(columns):
+                return None
+        data = {}
+        for entry in entries:
+            values = load_parts(path, entry['data'] if part is None else entry['data'][part:part + 1], rows)
+            if 'categories' in entry:
+                # tables only grow, so the latest one decodes every part
+                categories = np.load(os.path.join(path, entry['categories']), allow_pickle=True)
+                values = pd.Categorical.from_codes(values, categories)
+            data[entry['name']] = values
+        index = load_parts(path, meta['index'] if part is None else meta['index'][part:part + 1], rows)
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    return pd.DataFrame(data, index=index, columns=columns or [entry['name'] for entry in entries])
+
+
+def append_sidecar(file, df, source):
+    """
+    Store rows appended to the source file as one more part of each column.
+    source is the stamp of the file before the rows were appended; a sidecar
+    written for any other version of the file is left alone. Returns whether
+    the rows were added; a sidecar they do not fit is dropped to be rebuilt.
+    """
+    path = sidecar_path(file)
+    try:
+        meta = read_meta(path)
+    except (IOError, OSError, ValueError):
+        return False
+    if meta.get('version') != SIDECAR_VERSION or meta.get('source') != source:
+        return False
+    if [entry['name'] for entry in meta['columns']] != list(df.columns):
+        remove_sidecar(file)
+        return False
+
+    if not append_part(path, meta, df):
+        # the new rows changed the type of a column
+        remove_sidecar(file)
+        return False
+    meta['source'] = source_stamp(file)
+    write_meta(path, meta)
+    return True
+
+
+def append_part(path, meta, df):
+    # store df as one more part of every column and update meta, unless the
+    # rows change the type of a column; writing meta is left to the caller
+    part = len(meta['index'])
+    saved = []
+    for position, entry in enumerate(meta['columns']):
+        values = np.asarray(df[entry['name']])
+        name = '{}.{}.npy'.format(position, part)
+        if 'categories' in entry:
+            # codes of values seen before stay the same, new values go to the end of the table
+            categories = np.load(os.path.join(path, entry['categories']), allow_pickle=True)
+            codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+            known = dict((value, code) for code, value in enumerate(categories))
+            added = [value for value in uniques if value not in known]
+            for value in added:
+                known[value] = len(known)
+            # missing values have code -1, which picks the -1 at the end
+            mapping = np.array([known[value] for value in uniques] + [-1], dtype=np.int32)
+            np.save(os.path.join(path, name), mapping[codes])
+            if added:
+                table = '{}.cat.{}.npy'.format(position, part)
+                np.save(os.path.join(path, table), np.concatenate([categories, np.asarray(added, dtype=object)]))
+                saved.append((entry, 'categories', table))
+        elif values.dtype.kind == 'O' or values.dtype.kind != np.load(
+                os.path.join(path, entry['data'][0]), mmap_mode='r').dtype.kind:
+            return False
+        else:
+            np.save(os.path.join(path, name), values)
+            if 'order' in entry:
+                order, dates = save_sort_order(path, entry, position, values, meta['rows'], part)
+                saved.extend([(entry, 'order', order), (entry, 'sorted', dates)])
+        saved.append((entry, 'data', entry['data'] + [name]))
+    np.save(os.path.join(path, 'index.{}.npy'.format(part)),
+            np.arange(meta['rows'], meta['rows'] + len(df), dtype=np.int64))
+
+    for entry, key, value in saved:
+        entry[key] = value
+    meta['index'].append('index.{}.npy'.format(part))
+    meta['rows'] += len(df)
+    return True
+
+
+def has_date_order(file, column):
+    """
+    Whether an up to date sidecar stores the sort order of column; dates that
+    could not be parsed are kept as text, without one
+    """
+    try:
+        meta = read_meta(sidecar_path(file))
+        if meta.get('version') != SIDECAR_VERSION or meta['source'] != source_stamp(file):
+            return False
+        return any(entry['name'] == column and 'order' in entry for entry in meta['columns'])
+    except (IOError, OSError, ValueError, KeyError):
+        return False
+
+
+def date_rows(file, column, start=None, end=None):
+    """
+    Positions of the rows whose date in column falls in [start, end), in date
+    order, found by binary search of the sorted dates of each part. Without
+    bounds every row is returned, missing dates last. Returns None when there
+    is no up to date sidecar or it has no sort order for column.
+    """
+    path = sidecar_path(file)
+    try:
+        meta = read_meta(path)
+        if meta.get('version') != SIDECAR_VERSION or meta['source'] != source_stamp(file):
+            return None
+        entry = next((entry for entry in meta['columns'] if entry['name'] == column and 'order' in entry), None)
+        if entry is None:
+            return None
+        rows, dates, missing = [], [], []
+        for order_part, sorted_part in zip(entry['order'], entry['sorted']):
+            order = np.load(os.path.join(path, order_part), mmap_mode='r')
+            sorted_dates = np.load(os.path.join(path, sorted_part), mmap_mode='r')
+            first, last = 0, len(sorted_dates)
+            if start is not None:
+                first = np.searchsorted(sorted_dates, pd.Timestamp(start).to_datetime64())
+            if end is not None:
+                last = np.searchsorted(sorted_dates, pd.Timestamp(end).to_datetime64())
+            rows.append(np.asarray(order[first:last]))
+            dates.append(np.asarray(sorted_dates[first:last]))
+            if start is None and end is None:
+                missing.append(np.asarray(order[len(sorted_dates):]))
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+    if len(rows) > 1:
+        # parts are sorted on their own; merge the few rows picked from them
+        rows = [np.concatenate(rows)[np.argsort(np.concatenate(dates), kind='mergesort')]]
+    return np.concatenate(rows + missing)
+
+
+def remove_sidecar(file):
+    """
+    Drop the cached columns for an upload
+    """
+    shutil.rmtree(sidecar_path(file), ignore_errors=True)
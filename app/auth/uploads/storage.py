@@ -0,0 +1,182 @@
+# Imports
+from collections import namedtuple
+import hashlib
+import os
+import uuid
+
+import numpy as np
+
+# Local Imports
+from .ingest import parse_header_line, stream_upload, CHUNK_SIZE, ROW_INDEX_STEP
+from .row_index import RowIndexer, row_index_path, save_row_index, load_row_index, remove_row_index
+from .sidecar import sidecar_path, source_stamp, remove_sidecar
+
+# start is the byte offset of the first appended row, source the size and
+# modification time of the content before rows were appended to it, when its
+# column cache moved along; chain_sha256 the chained hash of the uploads
+AppendInfo = namedtuple('AppendInfo', ['path', 'sha256', 'chain_sha256', 'size', 'rows', 'added', 'start',
+                                       'headers', 'valid', 'source'])
+
+def makedirs(folder):
+    try:
+        os.makedirs(folder)
+    except OSError:
+        if not os.path.isdir(folder):
+            raise
+
+
+def content_path(folder, sha256, file_type):
+    """
+    Where content with the given hash is stored, fanned out over two levels
+    of subdirectories so no directory grows too large
+    """
+    return os.path.join(folder, sha256[:2], sha256[2:4], '{}.{}'.format(sha256, file_type))
+
+
+def is_stored(folder, file):
+    """
+    Whether a file path belongs to the content store under folder
+    """
+    return os.path.abspath(file).startswith(os.path.join(os.path.abspath(folder), ''))
+
+
+def store_upload(stream, folder, file_type, header_list, index_step=ROW_INDEX_STEP):
+    """
+    Save an upload under its content hash so identical content is stored once,
+    along with its row offset index.
+    Returns the upload info and whether the content was already stored.
+    """
+    incoming = os.path.join(folder, 'incoming')
+    makedirs(incoming)
+    tmp_path = os.path.join(incoming, uuid.uuid4().hex)
+    upload = stream_upload(stream, tmp_path, file_type, header_list, index_step=index_step)
+    if not upload.valid:
+        return upload, False
+
+    path = content_path(folder, upload.sha256, file_type)
+    duplicate = os.path.exists(path)
+    if duplicate:
+        os.remove(tmp_path)
+    else:
+        makedirs(os.path.dirname(path))
+        os.rename(tmp_path, path)
+    if upload.row_offsets is not None and not os.path.exists(row_index_path(path)):
+        save_row_index(path, index_step, upload.row_offsets)
+    return upload._replace(path=path), duplicate
+
+
+def chained_sha256(sha256, appended_sha256):
+    """
+    Identity of the uploads stored content was assembled from: the hash of
+    the first upload chained with the hash of each upload appended to it
+    """
+    return hashlib.sha256('{}:{}'.format(sha256, appended_sha256).encode('ascii')).hexdigest()
+
+
+def count_rows(file):
+    """
+    Data rows of a CSV/TSV file, for uploads stored before row counts were recorded
+    """
+    newlines = 0
+    last_byte = b''
+    with open(file, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            newlines += chunk.count(b'\n')
+            last_byte = chunk[-1:]
+    return max(0, newlines + (1 if last_byte not in (b'', b'\n') else 0) - 1)
+
+
+def append_upload(stream, folder, file, file_type, rows=None, chain_sha256=None, move_cache=False,
+                  index_step=ROW_INDEX_STEP):
+    """
+    Store the content made by appending the rows of a CSV/TSV upload, whose
+    header line repeats that of the stored file exactly, under its own hash.
+    The stored file is copied, never changed, so readers and other uploads
+    of it never see a partial append; the caller releases it. The row index
+    is extended with the offsets of the appended rows, and with move_cache
+    the column cache moves along for append_sidecar to extend. chain_sha256
+    is the chained hash of the uploads the stored file was assembled from.
+    Returns the append info.
+    """
+    with open(file, 'rb') as f:
+        headers = parse_header_line(f.readline(), file_type)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(0, size - 1))
+        last_byte = f.read(1)
+    if rows is None:
+        rows = count_rows(file)
+    source = source_stamp(file)
+
+    incoming = os.path.join(folder, 'incoming')
+    makedirs(incoming)
+    tmp_path = os.path.join(incoming, uuid.uuid4().hex)
+    combined_path = os.path.join(incoming, uuid.uuid4().hex)
+    delta = stream_upload(stream, tmp_path, file_type, headers, index_step=index_step)
+    info = AppendInfo(path=file, sha256=None, chain_sha256=chain_sha256, size=size, rows=rows, added=0,
+                      start=None, headers=delta.headers, valid=delta.valid and delta.headers == headers,
+                      source=None)
+    try:
+        if not info.valid or not delta.rows:
+            return info
+
+        # data row n starts after newline n, the header ending at newline 0
+        newline = last_byte not in (b'', b'\n')
+        start = size + (1 if newline else 0)
+        row_index = load_row_index(file)
+        step = row_index[0] if row_index is not None else index_step
+        indexer = RowIndexer(step, size, rows + (0 if newline else 1))
+        sha256 = hashlib.sha256()
+        with open(combined_path, 'wb') as out:
+            with open(file, 'rb') as stored:
+                for chunk in iter(lambda: stored.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+                    sha256.update(chunk)
+            with open(tmp_path, 'rb') as rows_file:
+                rows_file.readline()
+                if newline:
+                    out.write(b'\n')
+                    sha256.update(b'\n')
+                    indexer.feed(b'\n')
+                for chunk in iter(lambda: rows_file.read(CHUNK_SIZE), b''):
+                    out.write(chunk)
+                    sha256.update(chunk)
+                    indexer.feed(chunk)
+
+        path = content_path(folder, sha256.hexdigest(), file_type)
+        if os.path.exists(path):
+            # the same content is stored already, with its own derived files
+            source = None
+        else:
+            makedirs(os.path.dirname(path))
+            os.rename(combined_path, path)
+            if not (move_cache and os.path.isdir(sidecar_path(file))):
+                source = None
+            else:
+                try:
+                    os.rename(sidecar_path(file), sidecar_path(path))
+                except OSError:
+                    source = None
+            # indexes missing before are built on the next preview
+            if row_index is not None:
+                save_row_index(path, step, np.concatenate([row_index[1], indexer.result()]))
+        return info._replace(path=path, sha256=sha256.hexdigest(),
+                             chain_sha256=chained_sha256(chain_sha256, delta.sha256), size=os.path.getsize(path),
+                             rows=rows + delta.rows, added=delta.rows, start=start, source=source)
+    finally:
+        for leftover in (tmp_path, combined_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def release(file, references):
+    """
+    Remove stored content, its column cache and row index once no File row refers to it
+    """
+    if references > 0:
+        return False
+    remove_sidecar(file)
+    remove_row_index(file)
+    if os.path.exists(file):
+        os.remove(file)
+    return True
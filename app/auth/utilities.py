@@ -1,26 +1,242 @@
 # Imports
+import os
+
+from openpyxl import load_workbook
 import pandas as pd
 
-def create_df(file, file_type):
-    # Get file from server to process into data frame
-    if file_type == 'csv':
-        # Load CSV file type
-        df = pd.DataFrame(pd.read_csv(file, encoding='ISO-8859-1'))
-    elif file_type == 'tsv':
-        df = pd.DataFrame(pd.read_csv(file, encoding='ISO-8859-1', sep='\t'))
+# Local Imports
+from . import schema
+from .schema import DATE_COLUMNS
+from .uploads import sidecar
+from .uploads.row_index import seek_row
+
+# Rows converted at a time when reading a whole XLSX sheet
+XLSX_CHUNK_ROWS = 10000
+
+# Rows parsed at a time when reading CSV/TSV rows from a byte offset on
+TAIL_CHUNK_ROWS = 100000
+
+
+def read_options(file_type, profile=None):
+    # Delimiter and encoding of a CSV/TSV file, from its upload profile when there is one
+    sep = '\t' if file_type == 'tsv' else ','
+    encoding = 'ISO-8859-1'
+    if profile:
+        sep = profile.get('delimiter') or sep
+        encoding = profile.get('encoding') or encoding
+    return sep, encoding
+
+
+def column_dtypes(file, file_type, columns=None, profile=None):
+    # Explicit dtypes for read_csv: categoricals from the schema, numbers from the profile
+    if columns:
+        headers = columns
+    elif profile and profile.get('dtypes'):
+        headers = list(profile['dtypes'])
     else:
-        # Load files with excel based file extensions
-        df = pd.DataFrame(pd.read_excel(file, encoding='ISO-8859-1'))
+        sep, encoding = read_options(file_type, profile)
+        headers = pd.read_csv(file, encoding=encoding, sep=sep, nrows=0).columns.values.tolist()
+    dtypes = schema.read_dtypes(headers)
+    if profile and profile.get('dtypes'):
+        for column in headers:
+            dtype = profile['dtypes'].get(column, '')
+            if column not in dtypes and dtype.startswith(('int', 'float')):
+                dtypes[column] = dtype
+    return headers, dtypes
+
+
+def parse_date_columns(df, profile=None):
+    # Parse dates with the format recorded at upload instead of inferring it
+    date_format = profile.get('date_format') if profile else None
+    for column in DATE_COLUMNS:
+        if column in df.columns and df[column].dtype.kind != 'M':
+            try:
+                df[column] = pd.to_datetime(df[column], format=date_format)
+            except ValueError:
+                # leave the column as read_csv would when it cannot parse it
+                if date_format is None:
+                    continue
+                try:
+                    df[column] = pd.to_datetime(df[column])
+                except ValueError:
+                    pass
     return df
 
-def create_df_with_parse_date(file, file_type, parse):
-    if file_type == 'csv':
-        # Load CSV file type
-        df = pd.DataFrame(pd.read_csv(file, encoding='ISO-8859-1', parse_dates=['Ship Date', 'Order Date']))
-    elif file_type == 'tsv':
-        df = pd.DataFrame(pd.read_csv(file, encoding='ISO-8859-1', sep='\t', parse_dates=['Ship Date', 'Order Date']))
+
+def csv_date_option(headers, parse_dates, profile=None):
+    # read_csv infers dates itself only when no format is known
+    if not parse_dates or (profile and profile.get('date_format')):
+        return False
+    return [column for column in DATE_COLUMNS if column in headers]
+
+
+def iter_csv_from(file, start, encoding, sep, **options):
+    # read_csv chunks of the rows of a CSV/TSV file from byte offset start on
+    names = pd.read_csv(file, encoding=encoding, sep=sep, nrows=0).columns.values.tolist()
+    with open(file, 'rb') as f:
+        f.seek(start)
+        for chunk in pd.read_csv(f, encoding=encoding, sep=sep, header=None, names=names, **options):
+            yield chunk
+
+
+def read_file(file, file_type, columns=None, parse_dates=False, profile=None, start=None):
+    # Get file from server to process into data frame, reading only the given columns
+    # and, for CSV/TSV, only the rows from byte offset start on
+    if file_type in ('csv', 'tsv'):
+        sep, encoding = read_options(file_type, profile)
+        headers, dtypes = column_dtypes(file, file_type, columns, profile)
+        options = {'usecols': columns, 'dtype': dtypes,
+                   'parse_dates': csv_date_option(headers, parse_dates, profile)}
+        if start is None:
+            df = pd.read_csv(file, encoding=encoding, sep=sep, **options)
+        else:
+            df = pd.concat(list(iter_csv_from(file, start, encoding, sep, chunksize=TAIL_CHUNK_ROWS, **options)),
+                           ignore_index=True)
     else:
-        # Load files with excel based file extensions
-        df = pd.DataFrame(pd.read_excel(file, encoding='ISO-8859-1', parse_dates=['Ship Date', 'Order Date']))
+        # Stream the sheet rather than building the whole workbook in memory
+        df = pd.concat(list(iter_xlsx_chunks(file, XLSX_CHUNK_ROWS, columns)), ignore_index=True)
+    if columns is not None:
+        df = df[columns]
+    if parse_dates:
+        df = parse_date_columns(df, profile)
+    return schema.compact(df)
+
+
+def iter_chunks(file, file_type, chunksize, columns=None, parse_dates=False, profile=None):
+    # Read a file a chunk of rows at a time; XLSX sheets are streamed row by row
+    if file_type == 'xlsx':
+        chunks = (chunk.astype(schema.read_dtypes(chunk.columns))
+                  for chunk in iter_xlsx_chunks(file, chunksize, columns))
+    else:
+        sep, encoding = read_options(file_type, profile)
+        headers, dtypes = column_dtypes(file, file_type, columns, profile)
+        chunks = pd.read_csv(file, encoding=encoding, sep=sep, chunksize=chunksize, usecols=columns,
+                             dtype=dtypes, parse_dates=csv_date_option(headers, parse_dates, profile))
+    for chunk in chunks:
+        if parse_dates:
+            chunk = parse_date_columns(chunk, profile)
+        yield chunk
+
+
+def load_cached_df(file, file_type, columns=None, profile=None):
+    # Use the parsed column cache next to the upload, building it on first use
+    df = sidecar.load_sidecar(file, columns)
+    if df is None:
+        df = read_file(file, file_type, parse_dates=True, profile=profile)
+        sidecar.write_sidecar(file, df)
+        if columns is not None:
+            df = df[columns]
+    return df
+
+
+def cache_columns(file, file_type, chunksize=TAIL_CHUNK_ROWS, profile=None):
+    # Build the column cache of a file a chunk of rows at a time; returns whether it was written
+    chunks = (schema.compact(chunk)
+              for chunk in iter_chunks(file, file_type, chunksize, parse_dates=True, profile=profile))
+    return sidecar.write_sidecar_chunks(file, chunks)
+
+
+def load_date_range(file, file_type, parse, start=None, end=None, columns=None, profile=None, offset=0, rows=None):
+    # Rows whose parse date falls in [start, end), in date order, read through the sort
+    # order stored in the column cache; offset and rows page through them
+    positions = sidecar.date_rows(file, parse, start, end)
+    # a cache without the order of parse has it stored as text; rebuilding would not add one
+    if positions is None and not sidecar.has_sidecar(file) and cache_columns(file, file_type, profile=profile):
+        positions = sidecar.date_rows(file, parse, start, end)
+    if positions is None:
+        # dates that could not be parsed are not indexed, so keep the rows in
+        # range a chunk at a time
+        names = columns if columns is None or parse in columns else columns + [parse]
+        chunks = []
+        for chunk in iter_chunks(file, file_type, TAIL_CHUNK_ROWS, columns=names, parse_dates=True,
+                                 profile=profile):
+            # rows whose date cannot be read fall outside every range
+            chunk[parse] = pd.to_datetime(chunk[parse], errors='coerce')
+            if start is not None:
+                chunk = chunk[chunk[parse] >= start]
+            if end is not None:
+                chunk = chunk[chunk[parse] < end]
+            chunks.append(chunk)
+        if not chunks:
+            # a header without rows
+            return read_file(file, file_type, columns, parse_dates=True, profile=profile)
+        df = schema.compact(pd.concat(chunks)).sort_values(by=[parse])
+        if columns is not None:
+            df = df[columns]
+        return df.iloc[offset:None if rows is None else offset + rows]
+    positions = positions[offset:None if rows is None else offset + rows]
+    return sidecar.load_sidecar(file, columns, rows=positions)
+
+
+def create_df(file, file_type, cache=False, columns=None, profile=None):
+    if cache:
+        return load_cached_df(file, file_type, columns, profile)
+    return read_file(file, file_type, columns, profile=profile)
+
+
+def create_df_with_parse_date(file, file_type, parse, cache=False, columns=None, profile=None):
+    if cache:
+        # the column cache keeps the date order, so nothing is sorted here
+        return load_date_range(file, file_type, parse, columns=columns, profile=profile)
+    df = read_file(file, file_type, columns, parse_dates=True, profile=profile)
     df = df.sort_values(by=[parse], ascending=True)
     return df
+
+
+def iter_xlsx_rows(file, first_row=1, last_row=None):
+    # Stream cell values row by row from the first sheet without loading the workbook
+    if hasattr(file, 'read'):
+        workbook = load_workbook(file, read_only=True, data_only=True)
+        for row in workbook.worksheets[0].iter_rows(min_row=first_row, max_row=last_row):
+            yield [cell.value for cell in row]
+        return
+    with open(file, 'rb') as f:
+        for row in iter_xlsx_rows(f, first_row, last_row):
+            yield row
+
+
+def iter_xlsx_chunks(file, chunksize, columns=None):
+    # Data frames of up to chunksize rows of the first sheet, holding only the given columns
+    rows = iter_xlsx_rows(file)
+    headers = next(rows, [])
+    names = columns if columns is not None else [header for header in headers if header is not None]
+    positions = [headers.index(name) for name in names]
+    batch = []
+    empty = True
+    for row in rows:
+        # sheets often end with formatted but empty rows
+        if all(value is None for value in row):
+            continue
+        batch.append([row[position] if position < len(row) else None for position in positions])
+        if len(batch) == chunksize:
+            yield pd.DataFrame(batch, columns=names)
+            batch = []
+            empty = False
+    if batch or empty:
+        yield pd.DataFrame(batch, columns=names)
+
+
+def create_preview(file, file_type, rows=5, offset=0, profile=None, row_index=None):
+    # Read only the requested page of rows after the header
+    if file_type in ('csv', 'tsv'):
+        sep, encoding = read_options(file_type, profile)
+        start = seek_row(row_index, offset) if row_index is not None else None
+        if start is None:
+            df = pd.read_csv(file, encoding=encoding, sep=sep,
+                             skiprows=range(1, offset + 1), nrows=rows)
+        else:
+            # jump to the indexed row at or before the page and skip the few rows in between
+            position, skip = start
+            headers = pd.read_csv(file, encoding=encoding, sep=sep, nrows=0).columns.values.tolist()
+            if position >= os.path.getsize(file):
+                return pd.DataFrame(columns=headers)
+            with open(file, 'rb') as f:
+                f.seek(position)
+                df = pd.read_csv(f, encoding=encoding, sep=sep, header=None, names=headers,
+                                 skiprows=skip, nrows=rows)
+    else:
+        header = list(iter_xlsx_rows(file, 1, 1))[0]
+        data = list(iter_xlsx_rows(file, offset + 2, offset + 1 + rows))
+        df = pd.DataFrame(data, columns=header)
+    df.index = range(offset, offset + len(df))
+    return df
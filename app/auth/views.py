@@ -1,27 +1,138 @@
 # Imports
-import pdb
-from flask import flash, redirect, render_template, url_for, request, send_from_directory
+from flask import flash, redirect, render_template, url_for, request, send_from_directory, current_app, abort, jsonify, has_app_context, make_response
 from flask_login import login_required, login_user, logout_user, current_user
-import pandas as pd
+from sqlalchemy.orm import load_only
 from werkzeug.utils import secure_filename
-from bokeh.charts import Area, show
-from bokeh.embed import file_html
-from bokeh.models import NumeralTickFormatter, HoverTool
-from bokeh.resources import CDN
+from datetime import datetime, timedelta
 import os
-import copy
+import hashlib
+import json
+import zipfile
 
 # Local Imports
 import app
 from . import auth
-from .forms import LoginForm, RegistrationForm, UploadForm
-from .. import db
-from ..models import User, File
-from .uploads.file_validate import detect_file_type, has_valid_headers
-from .utilities import create_df, create_df_with_parse_date
+from .forms import LoginForm, RegistrationForm, UploadForm, BulkUploadForm
+from .schema import REQUIRED_COLUMNS
+from .. import db, chart_cache, jobs, identity
+from ..metrics import stage
+from ..models import User, File, Analysis
+from .engine import (append_analysis, append_upload, archive_members, build_range_monthly, build_row_index,
+                     chart_resources, create_preview, file_sha256, has_date_order, ingest_upload, is_stored,
+                     load_date_range, load_monthly, load_row_index, load_segments, monthly_series, release,
+                     remove_row_index, remove_sidecar, render_segment_areas, store_members, store_upload)
 
 # Global variables
 UPLOAD_FOLDER = '/tmp/renderbot_uploads'
+ANALYSIS_FOLDER = os.path.join(UPLOAD_FOLDER, 'analyses')
+RANGE_FOLDER = os.path.join(ANALYSIS_FOLDER, 'ranges')
+STORE_FOLDER = os.path.join(UPLOAD_FOLDER, 'store')
+VALID_FILE_TYPES = {'text/csv': 'csv', 'text/tab-separated-values': 'tsv', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx'}
+
+
+def build_options(upload=None):
+    """
+    How the analysis loader reads source files, from the app config and the
+    profile recorded for the upload
+    """
+    options = {'chunk_threshold': current_app.config.get('ANALYSIS_CHUNK_THRESHOLD'),
+               'chunksize': current_app.config.get('ANALYSIS_CHUNK_ROWS', 100000)}
+    if upload is not None:
+        options['profile'] = upload.profile
+    return options
+
+
+def profile_saver(file_id):
+    """
+    Job callback storing the profile of an upload on its File row
+    """
+    flask_app = current_app._get_current_object()
+
+    def save(profile):
+        def store():
+            upload = File.query.get(file_id)
+            if upload is not None:
+                upload.set_profile(profile)
+                db.session.commit()
+        # jobs finish on a pool thread, outside of any request
+        if has_app_context():
+            store()
+        else:
+            with flask_app.app_context():
+                store()
+    return save
+
+
+def date_range_args():
+    """
+    The time range picked with ?start= and ?end= (YYYY-MM-DD, both days
+    included) as datetimes with an exclusive end, None for a missing bound,
+    and the arguments themselves for links that keep the range
+    """
+    bounds, period = [], {}
+    for name, shift in (('start', 0), ('end', 1)):
+        value = request.args.get(name, '').strip()
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            bounds.append(datetime.strptime(value, '%Y-%m-%d') + timedelta(days=shift))
+        except ValueError:
+            abort(400)
+        period[name] = value
+    return bounds[0], bounds[1], period
+
+
+def find_upload(id):
+    """
+    Upload to display, read from the replica when there is one
+    """
+    with db.replica():
+        upload = identity.get(File, id)
+    # uploads made moments ago may not have reached the replica yet
+    return upload or identity.get_or_404(File, id)
+
+
+def record_analysis(upload, twin=None):
+    """
+    Add the analysis row pointing at where the aggregates of an upload are stored,
+    shared by every upload of the same content. The profile of twin, an upload
+    of identical content profiled before, is copied over. The caller commits.
+    """
+    analysis = Analysis(file=os.path.join(ANALYSIS_FOLDER, '{}.npz'.format(upload.sha256)),
+                        user_id=upload.user_id, source_file_id=upload.id)
+    db.session.add(analysis)
+    if twin is not None:
+        upload.copy_profile(twin)
+    return analysis
+
+
+def compute_analysis(upload, analysis):
+    """
+    Profile and aggregate a committed upload in the background unless identical
+    content has already been processed
+    """
+    if upload.dtypes is not None and os.path.exists(analysis.file):
+        return None
+    return jobs.submit('analysis-{}'.format(upload.id), ingest_upload,
+                       upload.file, upload.file_type, analysis.file, build=not os.path.exists(analysis.file),
+                       columnar=current_app.config.get('XLSX_COLUMNAR_CACHE', True),
+                       owner=upload.user_id, on_done=profile_saver(upload.id),
+                       **build_options())
+
+
+def materialize_analysis(upload):
+    """
+    Record the analysis of an upload and compute its aggregates once in the background
+    """
+    # identical content uploaded before has already been profiled and aggregated
+    twin = File.query.filter(File.sha256 == upload.sha256, File.id != upload.id,
+                             File.dtypes.isnot(None)).first()
+    analysis = record_analysis(upload, twin)
+    db.session.commit()
+    compute_analysis(upload, analysis)
+    return analysis
+
 
 @auth.route('/register', methods=['GET', 'POST'])
 def register():
@@ -65,6 +176,10 @@ def login():
         user = User.query.filter_by(email=form.email.data).first()
         if user is not None and user.verify_password(
                 form.password.data):
+            # bring the stored hash up to the configured cost
+            if user.upgrade_password(form.password.data):
+                db.session.commit()
+
             # log employee in
             login_user(user)
 
@@ -107,29 +222,29 @@ def upload_file():
     form = UploadForm()
     if request.method == 'POST':
         file = request.files['file']
-        valid_file_types = {'text/csv': 'csv', 'text/tab-separated-values': 'tsv', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx'}
         mimetype = file.mimetype
-        if mimetype in valid_file_types:
-            file_type = valid_file_types[mimetype]
-            # we need to change this if we later enable other analyses
-            column_headers = ['Order Date', 'Customer Segment', 'Profit', 'Sales', 'Product Category']
-            is_valid = has_valid_headers(file.stream, file_type, column_headers)
-            if not is_valid:
+        if mimetype in VALID_FILE_TYPES:
+            file_type = VALID_FILE_TYPES[mimetype]
+            column_headers = REQUIRED_COLUMNS
+            # save to app server (adjust path at top) while checking the headers
+            filename = secure_filename(file.filename)
+            upload, duplicate = store_upload(file.stream, STORE_FOLDER, file_type, column_headers,
+                                             index_step=current_app.config.get('ROW_INDEX_STEP', 1000))
+            if not upload.valid:
                 flash('This file has the wrong file headers. Please upload a file with the following headers: {}'.format(', '.join(column_headers)))
                 return redirect(url_for('auth.list_uploads'))
             else:
-                # save_file(file, file_type)
-                file.seek(0)
-                # save to app server (adjust path at top)
-                filename = secure_filename(file.filename)
-                file_path = os.path.join(UPLOAD_FOLDER, filename)
-                file.save(file_path)
                 # add file name to the database
-                form_filename = File(file=file_path,
+                form_filename = File(file=upload.path,
+                                     filename=filename,
                                      user_id=current_user.id,
-                                     file_type=file_type)
+                                     file_type=file_type,
+                                     sha256=upload.sha256,
+                                     row_count=upload.rows,
+                                     size=upload.size)
                 db.session.add(form_filename)
                 db.session.commit()
+                materialize_analysis(form_filename)
                 flash('You have uploaded {}.'.format(filename))
                 return redirect(url_for('auth.list_uploads'))
         else:
@@ -143,6 +258,158 @@ def upload_file():
                            form=form, title='Upload File')
 
 
+@auth.route('/uploads/append/<int:id>', methods=['GET', 'POST'])
+@login_required
+def append_rows(id):
+    """
+    Append the rows of a file to an existing data set, updating its
+    aggregates from the new rows only
+    """
+
+    upload = identity.get_or_404(File, id)
+    if upload.user_id != current_user.id:
+        abort(404)
+    form = UploadForm()
+    if request.method != 'POST':
+        return render_template('auth/uploads/append.html', form=form, upload=upload, title='Append Rows')
+
+    file = request.files['file']
+    if upload.file_type not in ('csv', 'tsv'):
+        flash('Rows can only be appended to CSV and TSV files. Please upload the whole Excel file again.')
+        return redirect(url_for('auth.list_uploads'))
+    if VALID_FILE_TYPES.get(file.mimetype) != upload.file_type:
+        flash('Please append a {} file to {}.'.format(upload.file_type.upper(), upload.name))
+        return redirect(url_for('auth.list_uploads'))
+    if jobs.find('analysis-{}'.format(upload.id)) is not None:
+        flash('{} is still being processed. Please try again shortly.'.format(upload.name))
+        return redirect(url_for('auth.list_uploads'))
+
+    # the column cache moves to the new content unless identical uploads still use it
+    analysis = analysis_for(upload)
+    previous_sha256, previous_file, previous_analysis = upload.sha256, upload.file, analysis.file
+    shared = File.query.filter(File.sha256 == upload.sha256, File.id != upload.id).count() > 0
+    profile = upload.profile
+    if profile is not None:
+        profile.update(rows=upload.row_count, size=upload.size,
+                       min_date=upload.min_date, max_date=upload.max_date)
+    appended = append_upload(file.stream, STORE_FOLDER, upload.file, upload.file_type,
+                             rows=upload.row_count, chain_sha256=upload.chain_sha256 or upload.sha256,
+                             move_cache=not shared, index_step=current_app.config.get('ROW_INDEX_STEP', 1000))
+    if not appended.valid:
+        flash('The rows to append must have the same headers as {}: {}'.format(
+            upload.name, ', '.join(appended.headers or [])))
+        return redirect(url_for('auth.list_uploads'))
+    if not appended.added:
+        flash('There are no rows to append in this file.')
+        return redirect(url_for('auth.list_uploads'))
+
+    # appends to the same upload are applied one after the other: the row only
+    # changes if no other append has replaced its content in the meantime
+    changed = File.query.filter_by(id=upload.id, sha256=previous_sha256).update(
+        {'file': appended.path, 'sha256': appended.sha256, 'chain_sha256': appended.chain_sha256,
+         'row_count': appended.rows, 'size': appended.size}, synchronize_session=False)
+    if not changed:
+        db.session.rollback()
+        release(appended.path, File.query.filter_by(file=appended.path).count())
+        flash('{} changed while your rows were being added. Please append them again.'.format(upload.name))
+        return redirect(url_for('auth.list_uploads'))
+    identity.discard(File, upload.id)
+    db.session.expire(upload)
+    analysis.file = os.path.join(ANALYSIS_FOLDER, '{}.npz'.format(appended.sha256))
+    # identical content may have been uploaded or assembled before
+    twin = File.query.filter(File.sha256 == appended.sha256, File.id != upload.id,
+                             File.dtypes.isnot(None)).first()
+    if twin is not None:
+        upload.copy_profile(twin)
+    db.session.commit()
+    if not shared:
+        chart_cache.invalidate(previous_sha256)
+        if is_stored(STORE_FOLDER, previous_file):
+            release(previous_file, File.query.filter_by(file=previous_file).count())
+
+    # fold the new rows into the stored aggregates in the background
+    if twin is None or not os.path.exists(analysis.file):
+        jobs.submit('analysis-{}'.format(upload.id), append_analysis,
+                    upload.file, upload.file_type, appended.start, previous_analysis, analysis.file,
+                    profile, appended.source, keep_previous=shared,
+                    owner=upload.user_id, on_done=profile_saver(upload.id), **build_options())
+    elif not shared and os.path.exists(previous_analysis):
+        os.remove(previous_analysis)
+    flash('You have appended {:,} rows to {}.'.format(appended.added, upload.name))
+    return redirect(url_for('auth.list_uploads'))
+
+
+@auth.route('/uploads/bulk', methods=['GET', 'POST'])
+@login_required
+def bulk_upload():
+    """
+    Handle uploads of several files or of zip archives of them
+    """
+
+    form = BulkUploadForm()
+    if request.method != 'POST':
+        return render_template('auth/uploads/bulk.html', form=form, title='Upload Files')
+
+    # expand archives into their members; files are only opened by the workers
+    max_files = current_app.config.get('BULK_UPLOAD_MAX_FILES', 100)
+    members = []
+    report = []
+    for file in request.files.getlist('files'):
+        if not file.filename:
+            continue
+        if file.filename.lower().endswith('.zip'):
+            try:
+                members.extend(archive_members(
+                    file.stream, max_files,
+                    max_member_bytes=current_app.config.get('BULK_UPLOAD_MAX_MEMBER_BYTES'),
+                    max_bytes=current_app.config.get('BULK_UPLOAD_MAX_BYTES')))
+            except (zipfile.BadZipfile, ValueError) as e:
+                report.append({'name': secure_filename(file.filename), 'status': 'error',
+                               'message': str(e), 'upload': None})
+        else:
+            members.append((file.filename, lambda file=file: file.stream))
+    if len(members) > max_files:
+        members = []
+        report.append({'name': None, 'status': 'error', 'upload': None,
+                       'message': 'Upload at most {} files at a time.'.format(max_files)})
+
+    # validate, hash and store the files concurrently
+    report = store_members(members, STORE_FOLDER, REQUIRED_COLUMNS,
+                           index_step=current_app.config.get('ROW_INDEX_STEP', 1000),
+                           workers=current_app.config.get('BULK_UPLOAD_WORKERS', 4)) + report
+
+    # record every accepted file and its analysis in one transaction
+    accepted = [entry for entry in report if entry['status'] == 'uploaded']
+    hashes = set(entry['upload'].sha256 for entry in accepted)
+    twins = {}
+    if hashes:
+        for twin in File.query.filter(File.sha256.in_(hashes), File.dtypes.isnot(None)):
+            twins.setdefault(twin.sha256, twin)
+    uploads = []
+    for entry in accepted:
+        upload = entry['upload']
+        uploads.append(File(file=upload.path, filename=entry['name'], user_id=current_user.id,
+                            file_type=entry['file_type'], sha256=upload.sha256,
+                            row_count=upload.rows, size=upload.size))
+    db.session.add_all(uploads)
+    db.session.flush()
+    analyses = [record_analysis(upload, twins.get(upload.sha256)) for upload in uploads]
+    db.session.commit()
+    for entry, upload, analysis in zip(accepted, uploads, analyses):
+        compute_analysis(upload, analysis)
+        entry['id'] = upload.id
+
+    results = [dict((key, entry.get(key)) for key in ('name', 'status', 'message', 'id'))
+               for entry in report]
+    for result, entry in zip(results, report):
+        upload = entry['upload']
+        result['rows'] = upload.rows if upload is not None else None
+        result['size'] = upload.size if upload is not None else None
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(files=results)
+    return render_template('auth/uploads/bulk.html', form=form, results=results, title='Upload Files')
+
+
 @auth.route('/uploads/uploads', methods=['GET', 'POST'])
 @login_required
 def list_uploads():
@@ -150,10 +417,40 @@ def list_uploads():
     List all user uploads
     """
 
-    uploads = File.query.filter_by(user_id=current_user.id)
+    # Keyset pagination on (user_id, id): a page is the uploads right after
+    # ?after=<id> or right before ?before=<id>, found through the composite index
+    per_page = current_app.config.get('UPLOADS_PER_PAGE', 50)
+    after = request.args.get('after', None, type=int)
+    before = request.args.get('before', None, type=int)
+
+    query = File.query.filter_by(user_id=current_user.id).options(
+        load_only('id', 'file', 'filename', 'file_type', 'size', 'row_count'))
+    if before is not None:
+        query = query.filter(File.id < before).order_by(File.id.desc())
+    else:
+        if after is not None:
+            query = query.filter(File.id > after)
+        query = query.order_by(File.id)
+    with db.replica():
+        uploads = query.limit(per_page + 1).all()
+
+    # the extra row only tells whether there is another page in that direction
+    more = len(uploads) > per_page
+    uploads = uploads[:per_page]
+    if before is not None:
+        uploads.reverse()
+    has_next = more if before is None else True
+    has_prev = more if before is not None else after is not None
+
+    # Uploads whose aggregates are still being computed in the background
+    processing = set(upload.id for upload in uploads
+                     if jobs.find('analysis-{}'.format(upload.id)) is not None)
 
     return render_template('auth/uploads/uploads.html',
-                           uploads=uploads, title="Uploads")
+                           uploads=uploads, processing=processing,
+                           next_after=uploads[-1].id if uploads and has_next else None,
+                           prev_before=uploads[0].id if uploads and has_prev else None,
+                           title="Uploads")
 
 @auth.route('/uploads/upload/<id>')
 @login_required
@@ -163,21 +460,61 @@ def single_file(id):
     """
 
     # Get file path from database by id
-    file = File.query.get_or_404(id).file
+    upload = find_upload(id)
+    if upload.user_id != current_user.id:
+        abort(404)
+    file = upload.file
 
     # Get filename for template
-    file_name = os.path.basename(file)
-    # Get file path and file extension
-    # file_path, file_extension = os.path.splitext(file_name)
-    file_type = File.query.get_or_404(id).file_type
-
-    df = create_df(file, file_type)
-
-    # Render data frame as sample of entire data set
-    df_head = df.head()
+    file_name = upload.name
+    file_type = upload.file_type
+
+    # Page through the file without loading all of it
+    rows = request.args.get('rows', current_app.config.get('PREVIEW_ROWS', 5), type=int)
+    rows = max(1, min(rows, current_app.config.get('PREVIEW_MAX_ROWS', 500)))
+    page = request.args.get('page', None, type=int)
+    if page is not None:
+        offset = (max(1, page) - 1) * rows
+    else:
+        offset = max(0, request.args.get('offset', 0, type=int))
+
+    start, end, period = date_range_args()
+    if period and has_date_order(file, 'Order Date'):
+        # orders in the time range, in date order, found through the sorted dates
+        with stage('preview'):
+            df_head = load_date_range(file, file_type, 'Order Date', start, end,
+                                      profile=upload.profile, offset=offset, rows=rows)
+    elif period:
+        # without the stored date order the whole file has to be read, so the
+        # page is found in the background, building the cache if there is none
+        key = 'preview-{}-{}-{}'.format(upload.id, strong_etag(period, offset, rows), current_user.id)
+        job_id = request.args.get('job')
+        job = jobs.get(job_id) if job_id else None
+        if job is None or job['owner'] != current_user.id or job['key'] != key:
+            job_id = jobs.submit(key, load_date_range, file, file_type, 'Order Date', start, end,
+                                 profile=upload.profile, offset=offset, rows=rows, owner=current_user.id)
+        if jobs.status(job_id)['state'] != 'done':
+            return render_template('auth/uploads/file.html', name=file_name, job_id=job_id,
+                                   id=id, rows=rows, offset=offset, period=period,
+                                   title="Data Preview")
+        df_head = jobs.result(job_id)
+    else:
+        # CSV/TSV pages are read by seeking to the nearest indexed row
+        row_index = None
+        if file_type in ('csv', 'tsv'):
+            row_index = load_row_index(file)
+            if row_index is None:
+                row_index = build_row_index(file, current_app.config.get('ROW_INDEX_STEP', 1000))
+        with stage('preview'):
+            df_head = create_preview(file, file_type, rows=rows, offset=offset,
+                                     profile=upload.profile, row_index=row_index)
 
     return render_template('auth/uploads/file.html', name=file_name,
                            data=df_head.to_html(),
+                           id=id, rows=rows, offset=offset, period=period,
+                           page=offset // rows + 1,
+                           prev_offset=max(0, offset - rows),
+                           has_more=len(df_head) == rows,
                            title="Data Preview")
 
 
@@ -188,65 +525,223 @@ def delete_upload(id):
     Delete a user file record / user access to the file (not an actual file) from the database
     """
 
-    uploads = File.query.get_or_404(id)
+    uploads = identity.get_or_404(File, id)
+    analysis_files = [analysis.file for analysis in uploads.analyses]
     db.session.delete(uploads)
     db.session.commit()
+
+    # Stored content and everything derived from it is shared by identical
+    # uploads, so only drop it once no other file refers to it
+    if uploads.sha256:
+        references = File.query.filter_by(sha256=uploads.sha256).count()
+    else:
+        references = 0
+    if is_stored(STORE_FOLDER, uploads.file):
+        release(uploads.file, references)
+    else:
+        # uploads saved before the content store keep their own column cache and row index
+        remove_sidecar(uploads.file)
+        remove_row_index(uploads.file)
+    if references == 0 and uploads.sha256:
+        chart_cache.invalidate(uploads.sha256)
+        if os.path.isdir(RANGE_FOLDER):
+            for name in os.listdir(RANGE_FOLDER):
+                if name.startswith(uploads.sha256 + '-'):
+                    os.remove(os.path.join(RANGE_FOLDER, name))
+    shared_analysis = os.path.join(ANALYSIS_FOLDER, '{}.npz'.format(uploads.sha256))
+    for analysis_file in analysis_files:
+        if (references == 0 or analysis_file != shared_analysis) and os.path.exists(analysis_file):
+            os.remove(analysis_file)
+
     flash('You have successfully deleted the file.')
 
     # redirect to the uploads page
     return redirect(url_for('auth.list_uploads'))
 
 
-@auth.route('/analyses/view/<int:id>', methods=['GET'])
-@login_required
-def create_analysis(id):
+def analysis_for(upload):
     """
-    View a pre-created analysis
+    The analysis of an upload, hashing uploads stored before hashes were recorded
     """
-    # Get file path from database by id
-    file = File.query.get_or_404(id).file
+    if upload.sha256 is None:
+        upload.sha256 = file_sha256(upload.file)
+        db.session.commit()
+    analysis = Analysis.query.filter_by(source_file_id=upload.id).first()
+    if analysis is None:
+        analysis = record_analysis(upload)
+        db.session.commit()
+    return analysis
 
-    # Get filename for template
-    file_name = os.path.basename(file)
-    file_type = File.query.get_or_404(id).file_type
-    df = create_df_with_parse_date(file, file_type, 'Order Date')
 
-    # Add columns for sales where profit is plus or zero to negative
-    df_sales = df
-    df_sales['Profitable'] = df['Sales'].where(df['Profit'] > 0, 0)
-    df_sales['Unprofitable'] = df['Sales'].where(df['Profit'] <= 0, 0)
+def selected_segments(analysis):
+    """
+    The segments picked with ?segment=..., all of them if none are. A segment
+    the aggregates of the upload do not have is a bad request rather than a
+    reason to chart them all; before the aggregates are built the render job
+    checks instead.
+    """
+    selected = sorted(set(request.args.getlist('segment')))
+    if selected and os.path.exists(analysis.file):
+        known = load_segments(analysis.file)
+        if any(segment not in known for segment in selected):
+            abort(400)
+    return selected
 
-    # Filter only columns needed
-    df_sales = df_sales[['Order Date', 'Customer Segment', 'Profit', 'Sales', 'Profitable', 'Unprofitable']]
 
-    # Group by Segment
-    df_sales2 = df_sales.groupby(['Customer Segment', 'Order Date']).sum()
-    df_sales2 = df_sales2.reset_index(drop=False)
+def range_analysis_file(upload, period):
+    """
+    Where the aggregates of the orders of an upload placed in a time range are stored
+    """
+    return os.path.join(RANGE_FOLDER, '{}-{}.npz'.format(upload.sha256, strong_etag(period)))
 
-    # Group by Month
-    df_mo = df_sales2.set_index('Order Date').groupby('Customer Segment').resample('M').sum()
-    df_mo = df_mo.reset_index(drop=False)
 
-    # Change column header to remove space for using as index
-    df_segs = df_mo.rename(columns={'Customer Segment': 'Segment'})
+def strong_etag(*parts):
+    """
+    ETag for a response that is fully determined by the given values
+    """
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
 
-    # Setting unique axis to pick up single Customer Segment
-    cons_df = df_segs[df_segs['Segment'] == df_segs.Segment.unique()[0]]
 
-    # Filter only columns for chart
-    cons_df_area = cons_df[['Order Date', 'Profitable', 'Unprofitable']]
+def revalidate(response, etag):
+    """
+    Tag a response and make clients check it with us before reusing it
+    """
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
 
-    # Reset index for chart axis labels
-    cons_df_area = cons_df_area.set_index(['Order Date']).resample('M').sum()
 
-    # When adding stack=True, Y labels skew.  Fixed with NumeralTickFormatter
-    title1 = df_segs.Segment.unique()[0]
-    cons_area = Area(cons_df_area, title=title1, legend="top_left",
-                xlabel='', ylabel='Sales', plot_width=700, plot_height=400,
-                stack=True, color=['#3288bd', '#99d594'],
-                    )
-    cons_area.yaxis[0].formatter = NumeralTickFormatter(format="0,00")
-    html = file_html(cons_area, CDN, "html")
+@auth.route('/analyses/view/<int:id>', methods=['GET'])
+@login_required
+def create_analysis(id):
+    """
+    View a pre-created analysis
+    """
+    upload = find_upload(id)
+    if upload.user_id != current_user.id:
+        abort(404)
+
+    # Look up the aggregates precomputed at upload; the render job builds them if missing
+    analysis = analysis_for(upload)
+
+    # Segments picked with ?segment=...; all of them by default
+    selected = selected_segments(analysis)
+    # Orders placed between ?start= and ?end=; all of them by default
+    start, end, period = date_range_args()
+    date_range = (start, end) if period else None
+
+    # The page only depends on the content, the selection and who is looking at it
+    plot_width, plot_height = 700, 400
+    etag = strong_etag(upload.sha256, 'segment_area', selected, period, plot_width, plot_height,
+                       current_user.id, current_user.username)
+    if etag in request.if_none_match:
+        return revalidate(current_app.response_class(status=304), etag)
+
+    # Charts are deterministic for the file content, so serve a cached render if there is one
+    cache_key = chart_cache.key(upload.sha256, 'segment_area_embed', segments=selected, period=period,
+                                plot_width=plot_width, plot_height=plot_height)
+    with stage('chart_cache'):
+        html = chart_cache.get(cache_key)
+    if html is None:
+        # Render in a job worker and let the page poll for it
+        job_id = jobs.submit('{}-{}'.format(cache_key, current_user.id), render_segment_areas,
+                             analysis.file, upload.file, upload.file_type,
+                             selected, plot_width, plot_height, date_range=date_range,
+                             owner=current_user.id,
+                             on_done=lambda result: chart_cache.set(cache_key, result),
+                             **build_options(upload))
+        if jobs.status(job_id)['state'] != 'done':
+            return render_template('auth/analyses/render.html', job_id=job_id, title="Area Chart")
+        html = jobs.result(job_id)
+
+    segments = load_segments(analysis.file) if os.path.exists(analysis.file) else []
 
     # this is a placeholder template
-    return render_template('auth/analyses/render.html', data=html, title="Area Chart")
+    with stage('template'):
+        response = make_response(render_template('auth/analyses/render.html', data=html, id=id,
+                                                  resources=chart_resources(),
+                                                  segments=segments, selected=selected, period=period,
+                                                  title="Area Chart"))
+    return revalidate(response, etag)
+
+
+@auth.route('/analyses/data/<int:id>', methods=['GET'])
+@login_required
+def analysis_data(id):
+    """
+    Monthly profitable / unprofitable sales series of an upload as JSON
+    """
+    upload = find_upload(id)
+    if upload.user_id != current_user.id:
+        abort(404)
+    analysis = analysis_for(upload)
+    selected = selected_segments(analysis)
+    start, end, period = date_range_args()
+
+    # The series only depend on the content, so clients revalidate with the hash
+    etag = strong_etag(upload.sha256, 'segment_monthly', selected, period)
+    if etag in request.if_none_match:
+        return revalidate(current_app.response_class(status=304), etag)
+
+    if period:
+        # totals of only the orders in the time range, stored by the job for
+        # whichever worker serves the next request
+        range_file = range_analysis_file(upload, period)
+        if not os.path.exists(range_file):
+            job_id = jobs.submit('range-{}-{}'.format(os.path.basename(range_file), current_user.id),
+                                 build_range_monthly, upload.file, upload.file_type, start, end, range_file,
+                                 profile=upload.profile, owner=current_user.id)
+            status = jobs.status(job_id)
+            if status['state'] == 'failed':
+                return jsonify(status), 500
+            if status['state'] != 'done':
+                return jsonify(status), 202
+        monthly = load_monthly(range_file)
+    elif not os.path.exists(analysis.file):
+        job_id = jobs.submit('analysis-{}'.format(upload.id), ingest_upload,
+                             upload.file, upload.file_type, analysis.file,
+                             columnar=current_app.config.get('XLSX_COLUMNAR_CACHE', True),
+                             owner=current_user.id, on_done=profile_saver(upload.id),
+                             **build_options())
+        return jsonify(jobs.status(job_id)), 202
+    else:
+        monthly = load_monthly(analysis.file)
+
+    series = monthly_series(monthly, selected)
+    response = current_app.response_class(json.dumps(series, separators=(',', ':')),
+                                          mimetype='application/json')
+    return revalidate(response, etag)
+
+
+@auth.route('/analyses/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """
+    Report the state of a background job as JSON
+    """
+    job = jobs.get(job_id)
+    if job is None or job['owner'] != current_user.id:
+        abort(404)
+    return jsonify(jobs.status(job_id))
+
+
+@auth.route('/analyses/jobs/<job_id>/result', methods=['GET'])
+@login_required
+def job_result(job_id):
+    """
+    Return the page rendered by a finished background job. Jobs producing
+    data rather than a page, such as ingests, have no result to serve.
+    """
+    job = jobs.get(job_id)
+    if job is None or job['owner'] != current_user.id:
+        abort(404)
+    status = jobs.status(job_id)
+    if status['state'] == 'failed':
+        return jsonify(status), 500
+    if status['state'] != 'done':
+        return jsonify(status), 202
+    result = jobs.result(job_id)
+    if not isinstance(result, str):
+        abort(404)
+    return result
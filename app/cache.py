@@ -0,0 +1,153 @@
+# Imports
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+
+class ChartCache(object):
+    """
+    Cache of rendered chart HTML keyed by source content hash, analysis and
+    chart parameters. Entries live in a size bounded folder on disk, evicted
+    least recently used first, with the most recent ones also kept in memory.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.max_bytes = 0
+        self.memory_items = 0
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # imported here, the upload modules import the app package themselves
+        from .auth.uploads.storage import makedirs
+        self.folder = app.config.get('CHART_CACHE_FOLDER', '/tmp/renderbot_uploads/charts')
+        self.max_bytes = app.config.get('CHART_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        self.memory_items = app.config.get('CHART_CACHE_MEMORY_ITEMS', 32)
+        # every worker creates the folder on start; the ones that lose the race find it there
+        makedirs(self.folder)
+
+    def key(self, content_hash, analysis, **params):
+        """
+        Build the cache key; the content hash comes first so that every
+        chart of a file can be dropped together
+        """
+        encoded = json.dumps(params, sort_keys=True).encode('utf-8')
+        return '{}-{}-{}'.format(content_hash, analysis, hashlib.sha1(encoded).hexdigest())
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.html')
+
+    def get(self, key):
+        """
+        Return cached HTML or None
+        """
+        path = self.path(key)
+        with self.lock:
+            html = self.memory.get(key)
+            if html is not None:
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+        if html is not None:
+            try:
+                self.touch(path)
+            except OSError:
+                pass
+            return html
+
+        try:
+            with open(path, 'r') as f:
+                html = f.read()
+            self.touch(path)
+        except (IOError, OSError):
+            with self.lock:
+                self.counters['misses'] += 1
+            return None
+
+        with self.lock:
+            self.counters['disk_hits'] += 1
+            self.remember(key, html)
+        return html
+
+    def set(self, key, html):
+        """
+        Store rendered HTML and evict old entries past the size limit
+        """
+        path = self.path(key)
+        # workers of several processes can share the folder, so the name is unique to this write
+        tmp_path = '{}.{}.tmp'.format(path, uuid.uuid4().hex)
+        with open(tmp_path, 'w') as f:
+            f.write(html)
+        os.rename(tmp_path, path)
+        self.touch(path)
+        with self.lock:
+            self.remember(key, html)
+        self.evict()
+
+    def touch(self, path):
+        # the modification time orders disk eviction; set it explicitly
+        # since file system timestamps can be coarser than the clock
+        now = time.time()
+        os.utime(path, (now, now))
+
+    def remember(self, key, html):
+        # callers hold the lock
+        self.memory[key] = html
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.folder):
+            if not name.endswith('.html'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        while total > self.max_bytes and entries:
+            mtime, size, name = entries.pop(0)
+            self.discard(name[:-len('.html')])
+            total -= size
+            with self.lock:
+                self.counters['evictions'] += 1
+
+    def discard(self, key):
+        with self.lock:
+            self.memory.pop(key, None)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def invalidate(self, content_hash):
+        """
+        Drop every cached chart rendered from the given content
+        """
+        prefix = content_hash + '-'
+        with self.lock:
+            keys = [key for key in self.memory if key.startswith(prefix)]
+        for name in os.listdir(self.folder):
+            if name.startswith(prefix) and name.endswith('.html'):
+                keys.append(name[:-len('.html')])
+        for key in set(keys):
+            self.discard(key)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['memory_items'] = len(self.memory)
+        return stats
@@ -0,0 +1,105 @@
+# Imports
+from contextlib import contextmanager
+import time
+
+from flask import has_request_context, session as user_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, exc, orm
+from sqlalchemy.pool import Pool
+
+# Engine options only a queue pool accepts; SQLite gets a NullPool or StaticPool instead
+POOL_SIZING_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
+
+
+def ping_connection(dbapi_connection, connection_record, connection_proxy):
+    # Check a pooled connection before handing it out; the pool replaces
+    # connections the server dropped (wait_timeout, failover) and retries
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    except Exception:
+        raise exc.DisconnectionError()
+    finally:
+        cursor.close()
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session sending the queries made inside Database.replica() blocks to the
+    read replica, and everything else, flushes included, to the primary
+    """
+
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.info.get('replica') and not self._flushing and self.db.has_replica(self.app):
+            return self.db.get_engine(self.app, bind='replica')
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class Database(SQLAlchemy):
+    """
+    Flask-SQLAlchemy with pool settings and an optional read replica taken
+    from the app config:
+
+    SQLALCHEMY_POOL_SIZE / _MAX_OVERFLOW / _TIMEOUT / _RECYCLE
+        read by Flask-SQLAlchemy itself, for the primary and the replica; the
+        sizing is left out for SQLite, which does not use a queue pool
+    SQLALCHEMY_POOL_PRE_PING
+        test pooled connections with SELECT 1 before use
+    SQLALCHEMY_REPLICA_URI
+        database read only queries are routed to; without one they go to the primary
+    SQLALCHEMY_REPLICA_LAG
+        seconds a user reads from the primary after writing, so that they see their changes
+    """
+
+    def __init__(self, *args, **kwargs):
+        SQLAlchemy.__init__(self, *args, **kwargs)
+        event.listen(self.session, 'after_flush', self.stick_to_primary)
+
+    def init_app(self, app):
+        replica_uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+        if replica_uri:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds['replica'] = replica_uri
+            app.config['SQLALCHEMY_BINDS'] = binds
+        if app.config.get('SQLALCHEMY_POOL_PRE_PING') and not event.contains(Pool, 'checkout', ping_connection):
+            event.listen(Pool, 'checkout', ping_connection)
+        SQLAlchemy.init_app(self, app)
+
+    def apply_driver_hacks(self, app, info, options):
+        if info.drivername.startswith('sqlite'):
+            for option in POOL_SIZING_OPTIONS:
+                options.pop(option, None)
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+
+    def stick_to_primary(self, session, flush_context):
+        if has_request_context() and self.has_replica():
+            lag = self.get_app().config.get('SQLALCHEMY_REPLICA_LAG', 5)
+            user_session['primary_until'] = time.time() + lag
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def has_replica(self, app=None):
+        app = self.get_app(app)
+        return 'replica' in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+    @contextmanager
+    def replica(self):
+        """
+        Route the queries of the block to the read replica. Only use it for
+        reads that can be a little behind the primary.
+        """
+        session = self.session()
+        if has_request_context() and user_session.get('primary_until', 0) > time.time():
+            yield session
+            return
+        depth = session.info.get('replica', 0)
+        session.info['replica'] = depth + 1
+        try:
+            yield session
+        finally:
+            session.info['replica'] = depth
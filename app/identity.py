@@ -0,0 +1,112 @@
+# Imports
+from collections import OrderedDict
+import threading
+import time
+
+from flask import abort
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+
+class IdentityCache(object):
+    """
+    Primary key lookups of rows read on nearly every request, such as the
+    logged in user and the upload being viewed. Within a request the session
+    identity map answers repeated lookups; across requests the column values
+    are kept in process for a few seconds so the next request skips the
+    round trip. Updates and deletes drop the cached values.
+    """
+
+    def __init__(self, app=None, session=None):
+        self.session = session
+        self.ttl = 30
+        self.max_items = 1024
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'request_hits': 0, 'process_hits': 0, 'misses': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.ttl = app.config.get('IDENTITY_CACHE_TTL', 30)
+        self.max_items = app.config.get('IDENTITY_CACHE_ITEMS', 1024)
+
+    def watch(self, *models):
+        """
+        Drop cached rows of the given models when they are updated or deleted
+        """
+        for model in models:
+            event.listen(model, 'after_update', self.expire_instance)
+            event.listen(model, 'after_delete', self.expire_instance)
+
+    def expire_instance(self, mapper, connection, target):
+        self.discard(mapper.class_, inspect(target).identity)
+
+    def discard(self, model, ident):
+        if not isinstance(ident, tuple):
+            ident = (ident,)
+        with self.lock:
+            self.entries.pop((model, ident), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get(self, model, ident):
+        """
+        Instance of model with the given primary key, or None
+        """
+        try:
+            ident = (int(ident),)
+        except (TypeError, ValueError):
+            return None
+        session = self.session()
+
+        # already loaded in this request
+        instance = session.identity_map.get(identity_key(model, ident))
+        if instance is not None:
+            with self.lock:
+                self.counters['request_hits'] += 1
+            return instance
+
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get((model, ident))
+            if entry is not None and entry[0] < now:
+                del self.entries[(model, ident)]
+                entry = None
+            if entry is not None:
+                self.counters['process_hits'] += 1
+            else:
+                self.counters['misses'] += 1
+
+        if entry is not None:
+            # rebuild the row as if it had just been loaded, without a query
+            instance = inspect(model).class_manager.new_instance()
+            for key, value in entry[1].items():
+                setattr(instance, key, value)
+            make_transient_to_detached(instance)
+            return session.merge(instance, load=False)
+
+        instance = session.query(model).get(ident)
+        if instance is not None:
+            values = dict((attr.key, getattr(instance, attr.key)) for attr in inspect(model).column_attrs)
+            with self.lock:
+                self.entries[(model, ident)] = (now + self.ttl, values)
+                self.entries.move_to_end((model, ident))
+                while len(self.entries) > self.max_items:
+                    self.entries.popitem(last=False)
+        return instance
+
+    def get_or_404(self, model, ident):
+        instance = self.get(model, ident)
+        if instance is None:
+            abort(404)
+        return instance
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats['items'] = len(self.entries)
+        return stats
@@ -0,0 +1,157 @@
+# Imports
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import threading
+import uuid
+
+# Local Imports
+from .metrics import collected_call
+
+
+class InlineExecutor(object):
+    """
+    Runs jobs in the calling thread, a stand-in broker for tests and debugging
+    """
+
+    def __init__(self, workers=None):
+        pass
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True):
+        pass
+
+
+# Executors selectable with JOB_BACKEND; any callable taking the worker count
+# and returning an object with submit() / shutdown() can be configured instead
+EXECUTORS = {
+    'process': ProcessPoolExecutor,
+    'thread': ThreadPoolExecutor,
+    'inline': InlineExecutor,
+}
+
+
+class JobQueue(object):
+    """
+    Hands slow work (parsing, aggregation, rendering) to a worker pool so
+    requests can return a job id straight away and poll for the result
+    """
+
+    def __init__(self, app=None):
+        self.backend = 'process'
+        self.workers = 2
+        self.history = 100
+        self.executor = None
+        self.jobs = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        # called with ('job:<function>', stage timings) when a job succeeds
+        self.observer = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = app.config.get('JOB_BACKEND', 'process')
+        self.workers = app.config.get('JOB_WORKERS', 2)
+        self.history = app.config.get('JOB_HISTORY', 100)
+
+    def get_executor(self):
+        # created on first use so that prefork servers fork before the pool exists
+        with self.lock:
+            if self.executor is None:
+                factory = EXECUTORS.get(self.backend, self.backend)
+                self.executor = factory(self.workers)
+            return self.executor
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Queue fn(*args) and return the job id. A job already queued or running
+        under the same key is reused. on_done is called with the result when
+        the job succeeds; owner records who may read the job.
+        """
+        on_done = kwargs.pop('on_done', None)
+        owner = kwargs.pop('owner', None)
+        with self.lock:
+            job_id = self.pending.get(key)
+            if job_id is not None:
+                return job_id
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {'key': key, 'owner': owner, 'future': None}
+            self.pending[key] = job_id
+            while len(self.jobs) > self.history:
+                old_id, old_job = next(iter(self.jobs.items()))
+                if old_job['future'] is None or not old_job['future'].done():
+                    break
+                self.jobs.popitem(last=False)
+
+        def finished(future):
+            with self.lock:
+                if self.pending.get(key) == job_id:
+                    del self.pending[key]
+            if future.exception() is not None:
+                return
+            result, stages = future.result()
+            if self.observer is not None:
+                self.observer('job:{}'.format(getattr(fn, '__name__', 'job')), stages)
+            if on_done is not None:
+                on_done(result)
+
+        # jobs run wrapped so that worker processes send back their stage timings
+        future = self.get_executor().submit(collected_call, fn, *args, **kwargs)
+        with self.lock:
+            self.jobs[job_id]['future'] = future
+        future.add_done_callback(finished)
+        return job_id
+
+    def find(self, key):
+        """
+        Id of the job queued or running under key, if any
+        """
+        with self.lock:
+            return self.pending.get(key)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status(self, job_id):
+        """
+        State of a job: pending, running, done or failed; None if unknown
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        future = job['future']
+        if future is None or not (future.running() or future.done()):
+            state = 'pending'
+        elif future.running():
+            state = 'running'
+        elif future.exception() is not None:
+            state = 'failed'
+        else:
+            state = 'done'
+        status = {'id': job_id, 'state': state}
+        if state == 'failed':
+            status['error'] = str(future.exception())
+        return status
+
+    def result(self, job_id):
+        """
+        Result of a finished job, or None while it is still running
+        """
+        job = self.get(job_id)
+        if job is None or job['future'] is None or not job['future'].done():
+            return None
+        return job['future'].result()[0]
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
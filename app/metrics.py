@@ -0,0 +1,188 @@
+# Imports
+from collections import OrderedDict
+from contextlib import contextmanager
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds in seconds of the latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage timings of the request or job running on this thread, None when nothing collects them
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as one stage of the current request or job. Does nothing
+    unless timings are being collected on this thread.
+    """
+    stages = getattr(_local, 'stages', None)
+    if stages is None:
+        yield
+        return
+    start = time.time()
+    try:
+        yield
+    finally:
+        stages.append((name, time.time() - start))
+
+
+def timed_iter(iterable, name):
+    """
+    Yield from iterable, timing each step as the given stage
+    """
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def collected_call(fn, *args, **kwargs):
+    """
+    Run a job and return its result along with the stage timings recorded
+    while it ran, so that jobs in worker processes can report them
+    """
+    previous = getattr(_local, 'stages', None)
+    _local.stages = stages = []
+    start = time.time()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        _local.stages = previous
+    stages.append(('total', time.time() - start))
+    return result, stages
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_local, 'stages', None) is not None:
+        conn.info.setdefault('query_start', []).append(time.time())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if starts and getattr(_local, 'stages', None) is not None:
+        _local.stages.append(('db', time.time() - starts.pop()))
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        position = 0
+        while position < len(BUCKETS) and seconds > BUCKETS[position]:
+            position += 1
+        self.counts[position] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+class Metrics(object):
+    """
+    Latency histograms per route and stage. Requests, the database calls
+    they make and the stages timed with stage() inside them are collected
+    per request; jobs report the stages they ran under job:<function>.
+    Nothing is collected when METRICS_ENABLED is off.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.histograms = OrderedDict()
+        self.lock = threading.Lock()
+        self.sources = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        if not self.enabled:
+            return
+        app.before_request(self.start_request)
+        app.teardown_request(self.finish_request)
+        if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+
+    def add_source(self, name, stats):
+        """
+        Export the counters returned by stats() along with the histograms
+        """
+        self.sources[name] = stats
+
+    def start_request(self):
+        _local.stages = []
+        _local.request_start = time.time()
+
+    def finish_request(self, exception=None):
+        stages = getattr(_local, 'stages', None)
+        if stages is None:
+            return
+        _local.stages = None
+        stages.append(('total', time.time() - _local.request_start))
+        self.observe_stages(request.endpoint or 'unmatched', stages)
+
+    def observe_stages(self, route, stages):
+        """
+        Record the stages of one request or job; repeated stages are added up
+        """
+        if not self.enabled:
+            return
+        totals = OrderedDict()
+        for name, seconds in stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        with self.lock:
+            for name, seconds in totals.items():
+                histogram = self.histograms.get((route, name))
+                if histogram is None:
+                    histogram = self.histograms[(route, name)] = Histogram()
+                histogram.observe(seconds)
+
+    def to_json(self):
+        routes = OrderedDict()
+        with self.lock:
+            for (route, name), histogram in sorted(self.histograms.items()):
+                routes.setdefault(route, OrderedDict())[name] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'mean': histogram.sum / histogram.count if histogram.count else None,
+                    'buckets': OrderedDict(('+Inf' if bound == float('inf') else str(bound), count)
+                                           for bound, count in histogram.cumulative()),
+                }
+        counters = OrderedDict((name, stats()) for name, stats in self.sources.items())
+        return {'enabled': self.enabled, 'routes': routes, 'counters': counters}
+
+    def to_prometheus(self):
+        lines = ['# HELP renderbot_stage_seconds Time spent per route and stage',
+                 '# TYPE renderbot_stage_seconds histogram']
+        with self.lock:
+            for (route, name), histogram in sorted(self.histograms.items()):
+                labels = 'route="{}",stage="{}"'.format(route, name)
+                for bound, count in histogram.cumulative():
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('renderbot_stage_seconds_bucket{{{},le="{}"}} {}'.format(labels, le, count))
+                lines.append('renderbot_stage_seconds_sum{{{}}} {}'.format(labels, histogram.sum))
+                lines.append('renderbot_stage_seconds_count{{{}}} {}'.format(labels, histogram.count))
+        for source, stats in self.sources.items():
+            for name, value in sorted(stats().items()):
+                metric = 'renderbot_{}_{}'.format(source, name)
+                lines.append('# TYPE {} gauge'.format(metric))
+                lines.append('{} {}'.format(metric, value))
+        return '\n'.join(lines) + '\n'
@@ -1,9 +1,10 @@
 # Imports
+import json
+
 from flask_login import UserMixin
 from sqlalchemy.orm import relationship, backref
-from werkzeug.security import generate_password_hash, check_password_hash
 
-from app import db, login_manager
+from app import db, login_manager, identity, passwords
 
 class User(UserMixin, db.Model):
     """
@@ -35,18 +36,30 @@ class User(UserMixin, db.Model):
         """
         Set password to a hashed password
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
 
     def verify_password(self, password):
         """
         Check if hashed password matches actual password
         """
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+
+    def upgrade_password(self, password):
+        """
+        Rehash a verified password stored with outdated hashing parameters
+        """
+        if not passwords.needs_rehash(self.password_hash):
+            return False
+        self.password = password
+        return True
 
     # Set up user_loader
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # a user registered moments ago may not have reached the replica yet
+        with db.replica():
+            user = identity.get(User, user_id)
+        return user or identity.get(User, user_id)
 
     def __repr__(self):
         return '<User: {}>'.format(self.username)
@@ -60,11 +73,91 @@ class File(db.Model):
     # Ensures table will be named in plural and not in singular
     # as is the name of the model
     __tablename__ = 'files'
+    # Uploads are listed a page at a time by owner and id
+    __table_args__ = (db.Index('ix_files_user_id_id', 'user_id', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     file = db.Column(db.String(200), index=True)
+    filename = db.Column(db.String(200))
     file_type = db.Column(db.String(200), index=True)
+    sha256 = db.Column(db.String(64), index=True)
+    # Hashes of the uploads the content was assembled from, chained over appends
+    chain_sha256 = db.Column(db.String(64))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    # Dataset profile recorded at upload
+    row_count = db.Column(db.Integer)
+    size = db.Column(db.BigInteger)
+    delimiter = db.Column(db.String(8))
+    encoding = db.Column(db.String(20))
+    date_format = db.Column(db.String(32))
+    min_date = db.Column(db.DateTime)
+    max_date = db.Column(db.DateTime)
+    dtypes = db.Column(db.Text)
+    analyses = db.relationship('Analysis', backref='source_file',
+                               cascade='all, delete-orphan')
+
+    @property
+    def name(self):
+        """
+        Name the file was uploaded under
+        """
+        return self.filename or self.file[self.file.rindex('/') + 1:]
+
+    @property
+    def profile(self):
+        """
+        Load options recorded for the file at upload, or None until it has been profiled
+        """
+        if self.dtypes is None:
+            return None
+        return {'delimiter': self.delimiter,
+                'encoding': self.encoding,
+                'date_format': self.date_format,
+                'dtypes': json.loads(self.dtypes)}
+
+    def set_profile(self, profile):
+        """
+        Record a profile computed by profile_upload
+        """
+        self.row_count = profile['rows']
+        self.size = profile['size']
+        self.delimiter = profile['delimiter']
+        self.encoding = profile['encoding']
+        self.date_format = profile['date_format']
+        self.min_date = profile['min_date']
+        self.max_date = profile['max_date']
+        self.dtypes = json.dumps(profile['dtypes'])
+
+    def copy_profile(self, other):
+        """
+        Reuse the profile of another upload of the same content
+        """
+        for column in ['row_count', 'size', 'delimiter', 'encoding', 'date_format',
+                       'min_date', 'max_date', 'dtypes']:
+            setattr(self, column, getattr(other, column))
 
     def __repr__(self):
         return '<File: {}>'.format(self.name)
+
+
+class Analysis(db.Model):
+    """
+    Create an analyses table
+    Holds the path of the aggregates precomputed for a source file
+    """
+
+    # Ensures table will be named in plural and not in singular
+    # as is the name of the model
+    __tablename__ = 'analyses'
+
+    id = db.Column(db.Integer, primary_key=True)
+    file = db.Column(db.String(200), index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    source_file_id = db.Column(db.Integer, db.ForeignKey('files.id'), index=True)
+
+    def __repr__(self):
+        return '<Analysis: {}>'.format(self.file)
+
+
+# Rows looked up on every request are cached until they change
+identity.watch(User, File)
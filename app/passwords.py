@@ -0,0 +1,64 @@
+# Imports
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasher(object):
+    """
+    Hashes and checks passwords on a small thread pool. PBKDF2 runs in
+    hashlib with the GIL released, so a burst of logins is bounded to a few
+    cores while the other request threads keep serving pages.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'pbkdf2:sha256'
+        self.iterations = 50000
+        self.workers = 2
+        self.executor = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+        self.iterations = app.config.get('PASSWORD_HASH_ITERATIONS', 50000)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 2)
+
+    @property
+    def scheme(self):
+        """
+        Method string werkzeug stores in front of the salt, e.g. pbkdf2:sha256:50000
+        """
+        return '{}:{}'.format(self.method, self.iterations)
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(self.workers)
+            return self.executor
+
+    def hash_async(self, password):
+        return self.get_executor().submit(generate_password_hash, password, self.scheme)
+
+    def verify_async(self, password_hash, password):
+        return self.get_executor().submit(check_password_hash, password_hash, password)
+
+    def hash(self, password):
+        return self.hash_async(password).result()
+
+    def verify(self, password_hash, password):
+        return self.verify_async(password_hash, password).result()
+
+    def needs_rehash(self, password_hash):
+        """
+        Whether a stored hash was made with other parameters than the configured ones
+        """
+        return password_hash.split('$', 1)[0] != self.scheme
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
@@ -0,0 +1,104 @@
+"""
+Synthetic store data at any scale, in the schema of app/tests/store_data.csv.
+
+    $ python benchmarks/generate.py --rows 1000000 --format csv --output /tmp/store_1m.csv
+
+Rows are resampled from the sample file with fresh ids, order dates spread
+over several years and jittered amounts, so segment and month cardinality
+grow the way real extracts do. Data is written a chunk at a time.
+"""
+# Imports
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app', 'tests', 'store_data.csv')
+
+# Excel sheets hold at most 1,048,576 rows, the header included
+XLSX_MAX_ROWS = 1048575
+
+CHUNK_ROWS = 100000
+
+
+def load_sample(sample=SAMPLE):
+    return pd.read_csv(sample, encoding='ISO-8859-1', dtype={'Order Date': object, 'Ship Date': object})
+
+
+def short_dates(dates):
+    # same m/d/yy shape as the sample file
+    return (dates.dt.month.astype(str) + '/' + dates.dt.day.astype(str) + '/' +
+            (dates.dt.year % 100).map('{:02d}'.format))
+
+
+def synthetic_chunks(rows, sample=None, seed=0, chunk_rows=CHUNK_ROWS, years=4):
+    """
+    Data frames of synthetic rows, chunk_rows at a time, with dates parsed
+    """
+    sample = load_sample() if sample is None else sample
+    random = np.random.RandomState(seed)
+    start = pd.Timestamp('2012-01-01')
+    for first in range(0, rows, chunk_rows):
+        size = min(chunk_rows, rows - first)
+        chunk = sample.iloc[random.randint(0, len(sample), size)].reset_index(drop=True)
+        chunk['Row ID'] = np.arange(first + 1, first + size + 1)
+        chunk['Order ID'] = np.arange(first + 1, first + size + 1) + 100000
+        order_dates = start + pd.to_timedelta(random.randint(0, 365 * years, size), unit='D')
+        chunk['Order Date'] = pd.Series(order_dates)
+        chunk['Ship Date'] = chunk['Order Date'] + pd.to_timedelta(random.randint(0, 6, size), unit='D')
+        scale = random.uniform(0.5, 1.5, size)
+        chunk['Sales'] = (chunk['Sales'] * scale).round(2)
+        chunk['Profit'] = (chunk['Profit'] * scale).round(4)
+        yield chunk
+
+
+def write_delimited(path, rows, sep=',', **options):
+    for position, chunk in enumerate(synthetic_chunks(rows, **options)):
+        chunk['Order Date'] = short_dates(chunk['Order Date'])
+        chunk['Ship Date'] = short_dates(chunk['Ship Date'])
+        chunk.to_csv(path, sep=sep, index=False, header=position == 0, mode='w' if position == 0 else 'a',
+                     encoding='ISO-8859-1')
+
+
+def write_xlsx(path, rows, **options):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    header = None
+    for chunk in synthetic_chunks(min(rows, XLSX_MAX_ROWS), **options):
+        if header is None:
+            header = chunk.columns.values.tolist()
+            sheet.append(header)
+        for row in chunk.itertuples(index=False):
+            sheet.append([None if isinstance(value, float) and np.isnan(value) else
+                          value.to_pydatetime() if isinstance(value, pd.Timestamp) else
+                          value.item() if isinstance(value, np.generic) else value
+                          for value in row])
+    workbook.save(path)
+
+
+def generate(path, rows, file_type, **options):
+    """
+    Write rows of synthetic data to path as csv, tsv or xlsx
+    """
+    if file_type == 'xlsx':
+        write_xlsx(path, rows, **options)
+    else:
+        write_delimited(path, rows, sep='\t' if file_type == 'tsv' else ',', **options)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--format', choices=['csv', 'tsv', 'xlsx'], default='csv')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True)
+    args = parser.parse_args()
+    generate(args.output, args.rows, args.format, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
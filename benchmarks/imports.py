@@ -0,0 +1,72 @@
+"""
+Boot time and memory of the web app with and without the analysis stack.
+
+    $ python benchmarks/imports.py --repeat 5
+
+Each scenario runs in a fresh interpreter: 'boot' creates the app the way a
+worker does, 'preload' also imports the pandas/Bokeh stack the way
+ENGINE_PRELOAD does, and 'first_analysis' resolves it on first use instead.
+Reported are the fastest wall time, the peak RSS and which heavy modules
+ended up imported.
+"""
+# Imports
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the engine keeps out of a plain boot
+HEAVY_MODULES = ['pandas', 'numpy', 'bokeh', 'openpyxl']
+
+SCENARIO = """
+import json, sys, time
+start = time.time()
+from app import create_app
+app = create_app({config!r})
+boot = time.time() - start
+if {scenario!r} == 'preload':
+    from app.auth import engine
+    engine.preload()
+elif {scenario!r} == 'first_analysis':
+    from app.auth import engine
+    engine.render_segment_areas.resolve()
+seconds = time.time() - start
+peak = None
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmHWM:'):
+            peak = int(line.split()[1]) / 1024.0
+print(json.dumps({{'seconds': seconds, 'boot_seconds': boot, 'peak_rss_mb': peak,
+                  'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+SCENARIOS = ['boot', 'preload', 'first_analysis']
+
+
+def run_scenario(scenario, config):
+    code = SCENARIO.format(scenario=scenario, config=config, heavy=HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:<16} {:>10} {:>10} {:>10}  {}'.format('scenario', 'boot s', 'total s', 'peak MB', 'loaded'))
+    for scenario in args.scenarios:
+        runs = [run_scenario(scenario, args.config) for _ in range(args.repeat)]
+        best = min(runs, key=lambda run: run['seconds'])
+        print('{:<16} {:>10.3f} {:>10.3f} {:>10.1f}  {}'.format(
+            scenario, best['boot_seconds'], best['seconds'], max(run['peak_rss_mb'] or 0 for run in runs),
+            ', '.join(best['loaded']) or '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Login throughput at several password hashing costs.
+
+    $ python benchmarks/passwords.py --iterations 10000 50000 150000 --clients 8
+
+Each client thread checks a password the way the login view does, through
+the bounded hashing pool, so the numbers show what a burst of logins costs
+at each PBKDF2 iteration count.
+"""
+# Imports
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+
+from app.passwords import PasswordHasher
+
+
+def login_throughput(iterations, logins=200, clients=8, workers=2):
+    app = Flask(__name__)
+    app.config.update(PASSWORD_HASH_ITERATIONS=iterations, PASSWORD_HASH_WORKERS=workers)
+    hasher = PasswordHasher(app)
+    password_hash = hasher.hash('correct horse')
+
+    start = time.time()
+    with ThreadPoolExecutor(clients) as pool:
+        results = list(pool.map(lambda _: hasher.verify(password_hash, 'correct horse'), range(logins)))
+    elapsed = time.time() - start
+    hasher.shutdown()
+    assert all(results)
+    return {'iterations': iterations, 'logins': logins, 'seconds': elapsed,
+            'logins_per_second': logins / elapsed, 'ms_per_login': 1000.0 * elapsed / logins}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--iterations', type=int, nargs='+', default=[10000, 50000, 100000, 150000])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    print('{:>10} {:>10} {:>12} {:>12}'.format('iterations', 'logins', 'logins/s', 'ms/login'))
+    for iterations in args.iterations:
+        result = login_throughput(iterations, args.logins, args.clients, args.workers)
+        print('{iterations:>10} {logins:>10} {logins_per_second:>12.1f} {ms_per_login:>12.2f}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Timings and peak memory of the load -> aggregate -> render pipeline.
+
+    $ python benchmarks/pipeline.py --rows 10000 1000000 --formats csv tsv xlsx --output baseline.json
+    $ python benchmarks/pipeline.py --rows 10000 1000000 --compare baseline.json
+
+Synthetic inputs are generated once into --data. Every stage runs in a
+fresh process so its peak RSS is its own; the fastest of --repeat runs is
+kept. Results go to a JSON file that later runs can be compared against.
+"""
+# Imports
+import argparse
+from datetime import datetime
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generate import generate, XLSX_MAX_ROWS
+
+# Stages in pipeline order; the analysis stages are the steps behind create_analysis
+STAGES = ['has_valid_headers', 'create_df', 'create_df_with_parse_date',
+          'analysis_profile', 'analysis_aggregate', 'analysis_render']
+
+
+def run_stage(stage, path, file_type, workdir):
+    """
+    Run one stage on a source file and return its wall time in seconds
+    """
+    from app.auth.schema import REQUIRED_COLUMNS
+    from app.auth.uploads.file_validate import has_valid_headers
+    from app.auth.uploads.profile import profile_upload
+    from app.auth.utilities import create_df, create_df_with_parse_date
+
+    analysis_file = os.path.join(workdir, 'analysis.npz')
+    profile_file = os.path.join(workdir, 'profile.json')
+    profile = None
+    if os.path.exists(profile_file):
+        with open(profile_file) as f:
+            profile = json.load(f)
+    # the defaults create_app would configure
+    options = {'chunk_threshold': 64 * 1024 * 1024, 'chunksize': 100000, 'profile': profile}
+
+    if stage in ('analysis_aggregate', 'analysis_render'):
+        # bokeh is imported before the clock starts
+        from app.auth.analyses.render import build_monthly, render_segment_areas
+
+    start = time.time()
+    if stage == 'has_valid_headers':
+        has_valid_headers(path, file_type, REQUIRED_COLUMNS)
+    elif stage == 'create_df':
+        create_df(path, file_type)
+    elif stage == 'create_df_with_parse_date':
+        create_df_with_parse_date(path, file_type, 'Order Date')
+    elif stage == 'analysis_profile':
+        profile = profile_upload(path, file_type, options['chunksize'])
+    elif stage == 'analysis_aggregate':
+        build_monthly(path, file_type, analysis_file, **options)
+    elif stage == 'analysis_render':
+        render_segment_areas(analysis_file, path, file_type, **options)
+    elapsed = time.time() - start
+
+    if stage == 'analysis_profile':
+        with open(profile_file, 'w') as f:
+            json.dump(profile, f, default=str)
+    return elapsed
+
+
+def measure(stage, path, file_type, workdir, results):
+    # child process entry point: time the stage and report the peak RSS in MB
+    try:
+        seconds = run_stage(stage, path, file_type, workdir)
+    except Exception:
+        results.put({'error': traceback.format_exc()})
+        raise
+    results.put({'seconds': seconds, 'peak_rss_mb': peak_rss_mb()})
+
+
+def peak_rss_mb():
+    # VmHWM starts over with the new process image, while Linux carries
+    # ru_maxrss over from the parent through the exec of a spawned child
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except IOError:
+        pass
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024.0 ** (2 if sys.platform == 'darwin' else 1)
+
+
+def run_isolated(stage, path, file_type, workdir):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=measure, args=(stage, path, file_type, workdir, results))
+    process.start()
+    result = results.get()
+    process.join()
+    if 'error' in result:
+        raise RuntimeError('{} failed on {}:\n{}'.format(stage, path, result['error']))
+    return result
+
+
+def input_file(data, rows, file_type):
+    path = os.path.join(data, 'store_{}.{}'.format(rows, file_type))
+    if not os.path.exists(path):
+        generate(path + '.part', rows, file_type)
+        os.rename(path + '.part', path)
+    return path
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(rows, formats, stages, data, repeat=1):
+    import numpy
+    import pandas
+
+    results = {}
+    for file_type in formats:
+        for count in rows:
+            if file_type == 'xlsx' and count > XLSX_MAX_ROWS:
+                print('skipping xlsx/{}: sheets hold at most {} rows'.format(count, XLSX_MAX_ROWS))
+                continue
+            path = input_file(data, count, file_type)
+            workdir = tempfile.mkdtemp()
+            try:
+                for stage in stages:
+                    runs = [run_isolated(stage, path, file_type, workdir) for _ in range(repeat)]
+                    # aggregates and column caches are rebuilt on every run of a stage
+                    for name in os.listdir(workdir):
+                        if name.endswith('.npz'):
+                            os.remove(os.path.join(workdir, name))
+                    shutil.rmtree(path + '.cols', ignore_errors=True)
+                    result = {'seconds': min(run['seconds'] for run in runs),
+                              'peak_rss_mb': max(run['peak_rss_mb'] for run in runs),
+                              'rows': count, 'bytes': os.path.getsize(path)}
+                    key = '{}/{}/{}'.format(file_type, count, stage)
+                    results[key] = result
+                    print('{:<45} {:>10.3f} s {:>10.1f} MB'.format(key, result['seconds'], result['peak_rss_mb']))
+                    if stage == 'analysis_aggregate' and 'analysis_render' in stages:
+                        # render from fresh aggregates without timing their build again
+                        run_stage('analysis_aggregate', path, file_type, workdir)
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'meta': {'commit': git_commit(), 'date': datetime.utcnow().isoformat(),
+                     'python': platform.python_version(), 'pandas': pandas.__version__,
+                     'numpy': numpy.__version__, 'platform': platform.platform(), 'repeat': repeat},
+            'results': results}
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Print each timing next to the baseline; returns the keys that got slower
+    by more than threshold
+    """
+    slower = []
+    print('{:<45} {:>10} {:>10} {:>8} {:>10}'.format('stage', 'baseline', 'current', 'ratio', 'peak MB'))
+    for key, result in sorted(current['results'].items()):
+        before = baseline['results'].get(key)
+        if before is None:
+            continue
+        ratio = result['seconds'] / before['seconds'] if before['seconds'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            slower.append(key)
+            flag = ' slower'
+        print('{:<45} {:>10.3f} {:>10.3f} {:>8.2f} {:>10.1f}{}'.format(
+            key, before['seconds'], result['seconds'], ratio, result['peak_rss_mb'], flag))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 1000000, 10000000])
+    parser.add_argument('--formats', nargs='+', choices=['csv', 'tsv', 'xlsx'], default=['csv', 'tsv', 'xlsx'])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'renderbot_benchmarks'))
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data):
+        os.makedirs(args.data)
+    current = run(args.rows, args.formats, args.stages, args.data, args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(current, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()